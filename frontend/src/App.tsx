@@ -184,6 +184,7 @@ function App() {
     try {
       const res = await axios.post(`${import.meta.env.VITE_API_BASE}/token`, {
         identity,
+        room: import.meta.env.VITE_ROOM || identity,
         name: `Voice Agent Session`
       });
 
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""Recall-vs-latency sweep of the persona ANN index kinds against the exact flat baseline."""
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from typing import List
+
+import faiss
+import numpy as np
+
+from fakes import add_agent_to_path
+
+add_agent_to_path()
+from rag import ann  # noqa: E402
+
+
+def synthetic(n: int, d: int, queries: int, latent: int = 48, clusters: int = 256, seed: int = 0):
+    """Clustered vectors on a low-dimensional subspace, closer to sentence embeddings than isotropic noise."""
+    rng = np.random.default_rng(seed)
+    proj = rng.standard_normal((latent, d)).astype('float32')
+    centers = rng.standard_normal((clusters, latent)).astype('float32')
+
+    def draw(count: int) -> np.ndarray:
+        z = centers[rng.integers(0, clusters, count)] + 0.5 * rng.standard_normal((count, latent)).astype('float32')
+        return z @ proj + 0.05 * rng.standard_normal((count, d)).astype('float32')
+
+    xb = draw(n)
+    xq = draw(queries)
+    faiss.normalize_L2(xb)
+    faiss.normalize_L2(xq)
+    return xb, xq
+
+
+def measure(index, xq: np.ndarray, k: int, params=None, vectors=None, factor: int = 1):
+    """Single-query latency (the agent issues one query per turn) and the result ids."""
+    ids = np.full((len(xq), k), -1, dtype='int64')
+    times = []
+    for i in range(len(xq)):
+        t0 = time.perf_counter()
+        _, I = index.search(xq[i:i + 1], k * factor, params=params)
+        if vectors is not None:
+            _, found = ann.rerank(vectors, xq[i:i + 1], I[0], k)
+        else:
+            found = I[0]
+        times.append(time.perf_counter() - t0)
+        ids[i, :len(found)] = found[:k]
+    times.sort()
+    return ids, times[len(times) // 2] * 1000, times[int(len(times) * 0.99) - 1] * 1000
+
+
+def recall(truth: np.ndarray, got: np.ndarray) -> float:
+    return float(np.mean([len(set(t) & set(g)) / len(t) for t, g in zip(truth, got)]))
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--n', type=int, default=200_000, help='Corpus size in vectors (default: %(default)s).')
+    parser.add_argument('--dim', type=int, default=384, help='Embedding dimension (default: %(default)s).')
+    parser.add_argument('--queries', type=int, default=500, help='Number of timed queries (default: %(default)s).')
+    parser.add_argument('--k', type=int, default=4, help='Neighbours per query, as in RAG.topk (default: %(default)s).')
+    parser.add_argument('--rerank', type=int, default=8, help='IVF-PQ candidates per hit re-ranked exactly, as RAG does (default: %(default)s).')
+    parser.add_argument('--threads', type=int, default=1, help='FAISS OpenMP threads (default: %(default)s).')
+    args = parser.parse_args(argv)
+
+    faiss.omp_set_num_threads(args.threads)
+    xb, xq = synthetic(args.n, args.dim, args.queries)
+    ids = np.arange(args.n)
+    print(f'Corpus {args.n} x {args.dim}, {args.queries} queries, k={args.k}, auto kind: {ann.choose_kind(args.n)}')
+
+    flat = ann.build_index('flat', xb, ids)
+    truth, p50, p99 = measure(flat, xq, args.k)
+    print(f"{'kind':>6} {'param':>14} {'build s':>8} {'recall':>7} {'p50 ms':>8} {'p99 ms':>8}")
+    print(f"{'flat':>6} {'-':>14} {'-':>8} {1.0:7.3f} {p50:8.3f} {p99:8.3f}")
+
+    sweeps = {'hnsw': ('efSearch', [16, 32, 64, 128]), 'ivfpq': ('nprobe', [4, 8, 16, 32, 64])}
+    for kind, (name, values) in sweeps.items():
+        t0 = time.perf_counter()
+        index = ann.build_index(kind, xb, ids)
+        built = time.perf_counter() - t0
+        for v in values:
+            params = ann.search_params(index, nprobe=v, ef_search=v)
+            got, p50, p99 = measure(index, xq, args.k, params)
+            print(f"{kind:>6} {f'{name}={v}':>14} {built:8.1f} {recall(truth, got):7.3f} {p50:8.3f} {p99:8.3f}")
+            if kind == 'ivfpq':
+                got, p50, p99 = measure(index, xq, args.k, params, vectors=xb, factor=args.rerank)
+                print(f"{'+rr':>6} {f'x{args.rerank}':>14} {'':>8} {recall(truth, got):7.3f} {p50:8.3f} {p99:8.3f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""End-to-end voice-loop benchmark: N concurrent agent sessions against local provider stand-ins.
+
+Deepgram, ElevenLabs and OpenAI stand-ins run in a separate process, so the CPU and
+RSS reported are the agent's own. The LiveKit room is replayed in-process: each session
+hears the same PCM (a 16 kHz mono recording, or synthetic tone bursts) through
+`worker.handle_participant`. Turn latency runs from the end of each utterance in the
+replayed audio to the first reply frame the agent publishes back to the room.
+
+Each run appends one JSON line (git commit, parameters, results) to --out, so runs on
+different commits with the same parameters can be compared with --history.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import math
+import multiprocessing as mp
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import wave
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+
+from fakes import (FakeDeepgram, FakeElevenLabs, FakeOpenAI, FakeRemoteAudioTrack, FakeRoom, add_agent_to_path,
+                   install_fake_livekit)
+
+SAMPLE_RATE = 16000
+FRAME_MS = 20
+SILENCE_RMS = 300.0
+ROOT = Path(__file__).resolve().parents[2]
+DEFAULT_OUT = Path(__file__).resolve().parent / 'results' / 'e2e.jsonl'
+CORPUS = [
+    'The library opens at nine on weekdays and at ten on Saturdays. It is closed on Sundays.',
+    'Our support line answers calls between eight in the morning and six in the evening.',
+    'Refunds are processed within five business days after the returned item arrives.',
+    'The garden tour starts at the north gate and takes about forty minutes.',
+]
+
+
+def serve_providers(conn, opts: dict) -> None:
+    """Provider process: start the stand-ins, send their URLs, run until told to stop, send their counters."""
+    async def main() -> None:
+        async with FakeDeepgram(delay=opts['stt_delay'], endpointing_ms=opts['endpointing_ms'], silence_rms=SILENCE_RMS) as dg, \
+                FakeElevenLabs(handshake_delay=opts['tts_handshake']) as el, \
+                FakeOpenAI(opts['llm_first_token'], opts['llm_token'], opts['reply_words']) as oa:
+            conn.send({'deepgram': dg.url, 'elevenlabs': el.url, 'openai': oa.url})
+            await asyncio.get_running_loop().run_in_executor(None, conn.recv)
+            conn.send({'stt_bytes': dg.received, 'stt_finals': dg.finals, 'tts_connections': el.connections,
+                       'tts_contexts': el.contexts, 'llm_requests': oa.requests})
+    asyncio.run(main())
+
+
+def synth_speech(utterances: int, utterance_s: float, gap_s: float, lead_s: float) -> bytes:
+    """Tone bursts standing in for speech, separated by digital silence."""
+    rng = np.random.default_rng(0)
+    t = np.arange(int(utterance_s * SAMPLE_RATE)) / SAMPLE_RATE
+    parts = [np.zeros(int(lead_s * SAMPLE_RATE))]
+    for _ in range(utterances):
+        envelope = 0.6 + 0.4 * np.sin(2 * np.pi * 3 * t)
+        tone = np.sin(2 * np.pi * rng.uniform(150, 250) * t) * envelope * 6000 + rng.normal(0, 300, t.size)
+        parts += [tone, np.zeros(int(gap_s * SAMPLE_RATE))]
+    return np.concatenate(parts).clip(-32768, 32767).astype(np.int16).tobytes()
+
+
+def load_pcm(path: Path) -> bytes:
+    if path.suffix.lower() != '.wav':
+        return path.read_bytes()
+    with wave.open(str(path)) as w:
+        if (w.getframerate(), w.getnchannels(), w.getsampwidth()) != (SAMPLE_RATE, 1, 2):
+            raise SystemExit(f'{path}: expected 16 kHz mono 16-bit PCM')
+        return w.readframes(w.getnframes())
+
+
+def utterance_ends(pcm: bytes, min_silence_ms: int) -> List[int]:
+    """Byte offsets (frame-aligned) where speech is followed by at least `min_silence_ms` of silence or the end."""
+    frame_bytes = SAMPLE_RATE * FRAME_MS // 1000 * 2
+    frames = np.frombuffer(pcm[:len(pcm) - len(pcm) % frame_bytes], dtype=np.int16).astype(np.float32).reshape(-1, frame_bytes // 2)
+    loud = np.sqrt((frames * frames).mean(axis=1)) >= SILENCE_RMS
+    ends, quiet, last = [], 0, None
+    for i, is_loud in enumerate(loud):
+        if is_loud:
+            last, quiet = i, 0
+        elif last is not None:
+            quiet += FRAME_MS
+            if quiet >= min_silence_ms:
+                ends.append((last + 1) * frame_bytes)
+                last = None
+    if last is not None:
+        ends.append((last + 1) * frame_bytes)
+    return ends
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))]
+
+
+def first_replies(captured: List[float], ends: List[float], gap_s: float = 0.2) -> List[Optional[float]]:
+    """Latency from each utterance end to the first frame of a new reply burst before the next utterance ends."""
+    out = []
+    for k, end in enumerate(ends):
+        limit = ends[k + 1] if k + 1 < len(ends) else math.inf
+        prev, hit = -math.inf, None
+        for t in captured:
+            if t >= limit:
+                break
+            if t >= end and t - prev > gap_s:
+                hit = t - end
+                break
+            prev = t
+        out.append(hit)
+    return out
+
+
+async def run_session(worker, i: int, pcm: bytes, ends: List[int], speed: float, stagger: float, tail: float) -> dict:
+    await asyncio.sleep(i * stagger)
+    room = FakeRoom(f'bench-{i}')
+    track = FakeRemoteAudioTrack(SAMPLE_RATE, FRAME_MS)
+    session = asyncio.create_task(worker.handle_participant(room, 'bench'))
+    end_times: List[float] = []
+    pending = set(ends)
+
+    def on_frame(offset: int, now: float) -> None:
+        if offset in pending:
+            end_times.append(now)
+
+    error = None
+    try:
+        await room.subscribe(track)
+        await track.play(pcm, speed, on_frame)
+        await asyncio.sleep(tail)
+    finally:
+        session.cancel()
+        try:
+            await session
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            error = repr(e)
+    captured = room.local_participant.tracks[0].source.captured if room.local_participant.tracks else []
+    return {'latencies': first_replies(captured, end_times), 'error': error}
+
+
+def git_commit() -> str:
+    try:
+        rev = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'diff', '--quiet', 'HEAD', '--', 'services'], cwd=ROOT).returncode != 0
+        return rev + ('-dirty' if dirty else '')
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def prepare_env(workdir: Path, urls: dict, vad: bool) -> None:
+    env = {
+        'LIVEKIT_URL': 'ws://fake', 'LIVEKIT_API_KEY': 'bench', 'LIVEKIT_API_SECRET': 'bench',
+        'OPENAI_API_KEY': 'bench', 'DEEPGRAM_API_KEY': 'bench', 'ELEVENLABS_API_KEY': 'bench',
+        'DEEPGRAM_URL': urls['deepgram'], 'ELEVENLABS_WS_URL': urls['elevenlabs'], 'OPENAI_BASE_URL': urls['openai'],
+        'DB_URL': f'sqlite:///{workdir}/memory.db', 'TTS_CACHE_DIR': str(workdir / 'cache' / 'tts'),
+        'TRACE_PATH': str(workdir / 'traces.jsonl'), 'AGENT_VOICE_ID': 'bench', 'DEMO_USER_ID': '',
+        'RAG_RELOAD_POLL_S': '0', 'VAD_ENABLED': '1' if vad else '0',
+    }
+    os.environ.update(env)
+    os.chdir(workdir)
+
+
+def build_index(workdir: Path) -> None:
+    from rag.indexer import build_faiss
+    corpus = workdir / 'data' / 'persona' / 'bench'
+    corpus.mkdir(parents=True, exist_ok=True)
+    for i, text in enumerate(CORPUS):
+        (corpus / f'doc{i}.txt').write_text(' '.join([text] * 20))
+    build_faiss(str(corpus), str(workdir / 'data' / 'indexes' / 'default'))
+
+
+async def bench(args, urls: dict, workdir: Path) -> dict:
+    prepare_env(workdir, urls, args.vad)
+    add_agent_to_path()
+    install_fake_livekit()
+    build_index(workdir)
+    import worker
+    from metrics import metrics
+    await worker.warm_up()
+
+    pcm = load_pcm(args.pcm) if args.pcm else synth_speech(args.utterances, args.utterance_s, args.gap_s, args.lead_s)
+    ends = utterance_ends(pcm, args.endpointing_ms)
+    cpu0, wall0 = time.process_time(), time.perf_counter()
+    results = await asyncio.gather(*(run_session(worker, i, pcm, ends, args.speed, args.stagger_ms / 1000, args.tail_s)
+                                     for i in range(args.sessions)))
+    wall, cpu = time.perf_counter() - wall0, time.process_time() - cpu0
+    await worker.shutdown()
+
+    latencies = [l * 1000 for r in results for l in r['latencies'] if l is not None]
+    turns = sum(len(r['latencies']) for r in results)
+    return {
+        'turns': turns,
+        'answered': len(latencies),
+        'errors': [r['error'] for r in results if r['error']],
+        'latency_ms': {name: round(v, 1) if v is not None else None for name, v in
+                       (('p50', percentile(latencies, 0.5)), ('p95', percentile(latencies, 0.95)),
+                        ('p99', percentile(latencies, 0.99)), ('max', max(latencies, default=None)))},
+        'turns_per_s': round(len(latencies) / wall, 3),
+        'wall_s': round(wall, 2),
+        'cpu_s': round(cpu, 2),
+        'cpu_pct': round(100 * cpu / wall, 1),
+        'rss_peak_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'stages': metrics.summary(),
+    }
+
+
+def show_history(path: Path, n: int) -> None:
+    rows = [json.loads(line) for line in path.read_text().splitlines() if line.strip()][-n:] if path.exists() else []
+    print(f"{'commit':14s} {'sessions':>8s} {'turns':>7s} {'p50':>7s} {'p95':>7s} {'p99':>7s} {'turns/s':>8s} {'cpu%':>6s} {'rss MB':>7s}")
+    for r in rows:
+        lat = r['latency_ms']
+        print(f"{r['commit']:14s} {r['params']['sessions']:8d} {r['answered']:3d}/{r['turns']:<3d} "
+              f"{lat['p50'] or 0:7.0f} {lat['p95'] or 0:7.0f} {lat['p99'] or 0:7.0f} {r['turns_per_s']:8.2f} "
+              f"{r['cpu_pct']:6.1f} {r['rss_peak_mb']:7.0f}")
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sessions', type=int, default=4, help='Concurrent agent sessions (default: %(default)s).')
+    parser.add_argument('--pcm', type=Path, help='16 kHz mono 16-bit .wav or raw PCM to replay (default: synthetic).')
+    parser.add_argument('--utterances', type=int, default=5, help='Synthetic utterances per session (default: %(default)s).')
+    parser.add_argument('--utterance-s', type=float, default=2.0)
+    parser.add_argument('--gap-s', type=float, default=4.0, help='Silence after each synthetic utterance (default: %(default)s).')
+    parser.add_argument('--lead-s', type=float, default=3.0, help='Silence before the first utterance, covering the greeting.')
+    parser.add_argument('--speed', type=float, default=1.0, help='Replay speed relative to real time.')
+    parser.add_argument('--stagger-ms', type=float, default=0.0, help='Delay between session starts.')
+    parser.add_argument('--tail-s', type=float, default=3.0, help='Time to keep sessions open after the audio ends.')
+    parser.add_argument('--vad', action='store_true', help='Run with VAD_ENABLED (needs the Silero model).')
+    parser.add_argument('--stt-delay-ms', type=float, default=100.0)
+    parser.add_argument('--endpointing-ms', type=int, default=300)
+    parser.add_argument('--llm-first-token-ms', type=float, default=300.0)
+    parser.add_argument('--llm-token-ms', type=float, default=20.0)
+    parser.add_argument('--reply-words', type=int, default=40)
+    parser.add_argument('--tts-handshake-ms', type=float, default=150.0)
+    parser.add_argument('--out', type=Path, default=DEFAULT_OUT, help='JSON lines file results are appended to.')
+    parser.add_argument('--history', type=int, metavar='N', help='Print the last N results from --out and exit.')
+    args = parser.parse_args(argv)
+    if args.history:
+        show_history(args.out, args.history)
+        return 0
+
+    opts = {'stt_delay': args.stt_delay_ms / 1000, 'endpointing_ms': args.endpointing_ms, 'tts_handshake': args.tts_handshake_ms / 1000,
+            'llm_first_token': args.llm_first_token_ms / 1000, 'llm_token': args.llm_token_ms / 1000, 'reply_words': args.reply_words}
+    ctx = mp.get_context('spawn')
+    parent, child = ctx.Pipe()
+    providers = ctx.Process(target=serve_providers, args=(child, opts), daemon=True)
+    providers.start()
+    urls = parent.recv()
+    out = args.out.resolve()
+    try:
+        with tempfile.TemporaryDirectory(prefix='bench-e2e-') as workdir:
+            cwd = os.getcwd()
+            try:
+                results = asyncio.run(bench(args, urls, Path(workdir)))
+            finally:
+                os.chdir(cwd)
+        parent.send('stop')
+        results['providers'] = parent.recv()
+    finally:
+        providers.join(5)
+        if providers.is_alive():
+            providers.terminate()
+
+    params = {k: (str(v) if isinstance(v, Path) else v) for k, v in vars(args).items() if k not in ('out', 'history')}
+    row = {'ts': time.time(), 'commit': git_commit(), 'python': platform.python_version(), 'cpus': os.cpu_count(),
+           'params': params, **results}
+    out.parent.mkdir(parents=True, exist_ok=True)
+    with open(out, 'a') as f:
+        f.write(json.dumps(row) + '\n')
+    print(json.dumps(row, indent=2))
+    print()
+    show_history(out, 5)
+    return 1 if results['errors'] or not results['answered'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
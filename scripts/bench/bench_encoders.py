@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""Compare the torch and ONNX (fp32 / int8) RAG query encoders: startup, per-query latency, RSS and drift."""
+from __future__ import annotations
+
+import argparse
+import multiprocessing as mp
+import os
+import sys
+import time
+from pathlib import Path
+from typing import List
+
+from fakes import add_agent_to_path
+
+MODEL = 'sentence-transformers/all-MiniLM-L6-v2'
+QUERIES = [
+    'what did you do last weekend',
+    'tell me about the book you mentioned',
+    'how do you usually start your morning',
+    'do you remember what we talked about yesterday',
+    'what is your favourite place in the city',
+    'can you recommend something to cook tonight',
+    'why do you like walking by the river',
+    'what music were you listening to',
+]
+
+
+def rss_mb() -> float:
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+
+
+def run_backend(backend: str, onnx_dir: str, threads: int, rounds: int, out) -> None:
+    os.environ.update(RAG_ENCODER='onnx' if backend != 'torch' else 'torch', RAG_ONNX_DIR=onnx_dir,
+                      RAG_ONNX_QUANTIZED='1' if backend == 'onnx-int8' else '0', RAG_ENCODER_THREADS=str(threads))
+    add_agent_to_path()
+    base = rss_mb()
+    t0 = time.perf_counter()
+    from rag.encoders import load_encoder
+    enc = load_encoder(MODEL)
+    enc.encode(['warm up'])
+    startup = time.perf_counter() - t0
+    times = []
+    for _ in range(rounds):
+        for q in QUERIES:
+            t = time.perf_counter()
+            enc.encode([q])
+            times.append(time.perf_counter() - t)
+    times.sort()
+    out.send({'startup_s': startup, 'p50_ms': times[len(times) // 2] * 1000, 'p95_ms': times[int(len(times) * 0.95)] * 1000,
+              'rss_mb': rss_mb() - base, 'embeddings': enc.encode(QUERIES)})
+
+
+def measure(backend: str, onnx_dir: str, threads: int, rounds: int) -> dict:
+    ctx = mp.get_context('spawn')
+    parent, child = ctx.Pipe()
+    proc = ctx.Process(target=run_backend, args=(backend, onnx_dir, threads, rounds, child))
+    proc.start()
+    result = parent.recv()
+    proc.join()
+    return result
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--onnx-dir', default='data/models/all-MiniLM-L6-v2-onnx', help='Exported model directory (default: %(default)s).')
+    parser.add_argument('--export', action='store_true', help='Export the ONNX models first (needs torch, transformers, onnxruntime).')
+    parser.add_argument('--threads', type=int, default=1, help='Encoder threads for every backend (default: %(default)s).')
+    parser.add_argument('--rounds', type=int, default=25, help='Passes over the query set (default: %(default)s).')
+    args = parser.parse_args(argv)
+
+    if args.export or not Path(args.onnx_dir, 'model.onnx').exists():
+        add_agent_to_path()
+        from rag.encoders import export_onnx
+        print(f'Exporting ONNX models to {args.onnx_dir} ...')
+        print(f'  min cosine vs torch: {export_onnx(MODEL, args.onnx_dir)}')
+
+    results = {b: measure(b, args.onnx_dir, args.threads, args.rounds) for b in ('torch', 'onnx-fp32', 'onnx-int8')}
+    ref = results['torch']['embeddings']
+    print(f"{'backend':>10} {'startup s':>10} {'p50 ms':>8} {'p95 ms':>8} {'RSS MB':>8} {'min cos':>8}")
+    for name, r in results.items():
+        cos = float((r['embeddings'] * ref).sum(1).min())
+        print(f"{name:>10} {r['startup_s']:10.2f} {r['p50_ms']:8.2f} {r['p95_ms']:8.2f} {r['rss_mb']:8.0f} {cos:8.5f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""Compare the serial persona loader with the process-pool DocumentLoader on a synthetic corpus."""
+from __future__ import annotations
+
+import argparse
+import random
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import List
+
+from fakes import add_agent_to_path
+
+add_agent_to_path()
+from rag.loaders import DocumentLoader, list_files, load_texts  # noqa: E402
+
+WORDS = 'persona voice memory river lantern quiet morning story garden letter window ocean'.split()
+
+
+def _pdf_escape(text: str) -> str:
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def write_pdf(path: Path, pages: List[List[str]]) -> None:
+    """Write a minimal text-only PDF (Helvetica, one text object per line)."""
+    objects = ['<< /Type /Catalog /Pages 2 0 R >>', None, '<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>']
+    kids = []
+    for lines in pages:
+        ops = ['BT', '/F1 10 Tf', '12 TL', '40 800 Td'] + [f'({_pdf_escape(line)}) Tj T*' for line in lines] + ['ET']
+        stream = '\n'.join(ops).encode('latin-1')
+        objects.append(f'<< /Length {len(stream)} >>\nstream\n{stream.decode("latin-1")}\nendstream')
+        content_ref = len(objects)
+        objects.append(f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Resources << /Font << /F1 3 0 R >> >> /Contents {content_ref} 0 R >>')
+        kids.append(f'{len(objects)} 0 R')
+    objects[1] = f'<< /Type /Pages /Kids [{" ".join(kids)}] /Count {len(kids)} >>'
+    out = bytearray(b'%PDF-1.4\n')
+    offsets = []
+    for i, obj in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f'{i} 0 obj\n{obj}\nendobj\n'.encode('latin-1')
+    xref = len(out)
+    out += f'xref\n0 {len(objects) + 1}\n0000000000 65535 f \n'.encode()
+    out += ''.join(f'{o:010d} 00000 n \n' for o in offsets).encode()
+    out += f'trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n'.encode()
+    path.write_bytes(bytes(out))
+
+
+def make_corpus(root: Path, pdfs: int, pages: int, texts: int, seed: int = 7) -> None:
+    rnd = random.Random(seed)
+    line = lambda: ' '.join(rnd.choice(WORDS) for _ in range(12))  # noqa: E731
+    for i in range(pdfs):
+        write_pdf(root / f'doc_{i:03d}.pdf', [[line() for _ in range(60)] for _ in range(pages)])
+    for i in range(texts):
+        (root / f'note_{i:03d}.md').write_text('\n'.join(line() for _ in range(400)), encoding='utf-8')
+
+
+def timed(fn):
+    t0 = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - t0
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--pdfs', type=int, default=24, help='Number of synthetic PDFs (default: %(default)s).')
+    parser.add_argument('--pages', type=int, default=40, help='Pages per PDF (default: %(default)s).')
+    parser.add_argument('--texts', type=int, default=24, help='Number of markdown files (default: %(default)s).')
+    parser.add_argument('--workers', type=int, default=None, help='Process pool size (default: CPU count).')
+    args = parser.parse_args(argv)
+
+    root = Path(tempfile.mkdtemp(prefix='loader-bench-'))
+    try:
+        corpus = root / 'corpus'
+        corpus.mkdir()
+        make_corpus(corpus, args.pdfs, args.pages, args.texts)
+        files = list_files(corpus)
+        print(f'Corpus: {len(files)} files, {args.pdfs}x{args.pages} PDF pages')
+
+        serial, t_serial = timed(lambda: load_texts(corpus))
+
+        def parallel(cache_dir):
+            loader = DocumentLoader(args.workers, cache_dir)
+            docs = [''.join(pieces) for _, pieces in loader.iter_documents((p, f'{p.name}-{p.stat().st_size}') for p in files)]
+            return docs, loader
+
+        (cold, loader), t_cold = timed(lambda: parallel(root / 'cache'))
+        (warm, warm_loader), t_warm = timed(lambda: parallel(root / 'cache'))
+
+        print(f'  serial load_texts       : {t_serial:7.3f}s')
+        print(f'  DocumentLoader (cold)   : {t_cold:7.3f}s  ({t_serial / t_cold:.2f}x, {loader.workers} workers, {loader.stats["tasks"]} tasks)')
+        print(f'  DocumentLoader (cached) : {t_warm:7.3f}s  ({t_serial / t_warm:.2f}x, {warm_loader.stats["cache_hits"]} cache hits)')
+        same = serial == cold == warm
+        print('✅ Output identical and in order.' if same else '✗ Parallel output differs from serial loader.')
+        return 0 if same else 1
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""Check that the STT client sustains real-time audio upload against a local Deepgram stand-in."""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import sys
+import time
+from typing import List
+
+from fakes import FakeDeepgram, add_agent_to_path
+
+add_agent_to_path()
+from stt.deepgram_stream import DeepgramStreamSTT  # noqa: E402
+
+SAMPLE_RATE = 16000
+BYTES_PER_SAMPLE = 2
+
+
+async def run(seconds: float, frame_ms: int, delay: float, speed: float) -> dict:
+    frame = bytes(SAMPLE_RATE * BYTES_PER_SAMPLE * frame_ms // 1000)
+    frames = int(seconds * 1000 / frame_ms)
+    period = frame_ms / 1000 / speed
+    events = {'interim': 0, 'final': 0}
+    lag: List[float] = []
+    async with FakeDeepgram(delay=delay) as dg:
+        async with DeepgramStreamSTT('test', sample_rate=SAMPLE_RATE, url=dg.url.split('?')[0]) as stt:
+            async def consume() -> None:
+                async for ev in stt:
+                    events['final' if ev.is_final else 'interim'] += 1
+            consumer = asyncio.create_task(consume())
+            start = time.perf_counter()
+            for i in range(frames):
+                await stt.send_pcm(frame)
+                target = start + (i + 1) * period
+                now = time.perf_counter()
+                lag.append(max(0.0, now - target))
+                if target > now:
+                    await asyncio.sleep(target - now)
+            while stt.sent_bytes < frames * len(frame) and stt.dropped == 0:
+                await asyncio.sleep(0.005)
+            elapsed = time.perf_counter() - start
+            await asyncio.sleep(delay + 0.05)
+            consumer.cancel()
+        sent = frames * len(frame)
+    return {
+        'audio_s': seconds,
+        'wall_s': elapsed,
+        'realtime_factor': seconds / elapsed,
+        'sent_bytes': sent,
+        'server_bytes': dg.received,
+        'dropped_frames': stt.dropped,
+        'max_send_lag_ms': max(lag) * 1000 if lag else 0.0,
+        **events,
+    }
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--seconds', type=float, default=10.0, help='Seconds of audio to stream (default: %(default)s).')
+    parser.add_argument('--frame-ms', type=int, default=20, help='Frame size in milliseconds (default: %(default)s).')
+    parser.add_argument('--transcript-delay', type=float, default=0.3, help='Simulated transcription latency in seconds.')
+    parser.add_argument('--speed', type=float, default=1.0, help='Playback speed; >1 streams faster than real time.')
+    args = parser.parse_args(argv)
+
+    res = asyncio.run(run(args.seconds, args.frame_ms, args.transcript_delay, args.speed))
+    for key, value in res.items():
+        print(f"{key:>18}: {value:.3f}" if isinstance(value, float) else f"{key:>18}: {value}")
+
+    ok = res['dropped_frames'] == 0 and res['realtime_factor'] >= 0.95 * args.speed and res['interim'] + res['final'] > 0
+    print('✅ Sustained real-time upload.' if ok else '✗ STT upload fell behind real time.')
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
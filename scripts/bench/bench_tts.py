@@ -0,0 +1,52 @@
+"""Time-to-first-audio for a fresh ElevenLabs socket per reply vs the pooled sockets.
+
+Runs against FakeElevenLabs, whose handshake delay stands in for TLS + voice init.
+Also cancels every third reply mid-stream to check the pooled socket stays usable.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import statistics
+import time
+
+from fakes import FakeElevenLabs, add_agent_to_path
+
+add_agent_to_path()
+from tts.pool import TtsPool  # noqa: E402
+
+SENTENCES = ['Sure, I can help with that.', 'The library opens at nine tomorrow.', 'Let me know if there is anything else.']
+
+
+async def reply(pool: TtsPool, cancel: bool) -> float:
+    t0 = time.perf_counter()
+    first = None
+    async with pool.stream('voice') as tts:
+        for s in SENTENCES:
+            await tts.send_text(s + ' ')
+        await tts.end()
+        async for _ in tts.recv_audio():
+            if first is None:
+                first = time.perf_counter() - t0
+                if cancel:
+                    break
+    return first
+
+
+async def run(turns: int, handshake: float) -> None:
+    async with FakeElevenLabs(handshake_delay=handshake) as fake:
+        for label, max_per_key in (('fresh', 0), ('pooled', 2)):
+            pool = TtsPool('test', max_per_key=max_per_key, url=fake.url)
+            before = fake.connections
+            ttfa = [await reply(pool, cancel=i % 3 == 2) for i in range(turns)]
+            await pool.close()
+            print(f'{label:7s} ttfa p50 {statistics.median(ttfa)*1000:6.1f} ms  max {max(ttfa)*1000:6.1f} ms  '
+                  f'connections {fake.connections - before}  {pool.snapshot()}')
+
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument('--turns', type=int, default=30)
+    ap.add_argument('--handshake-ms', type=float, default=150)
+    args = ap.parse_args()
+    asyncio.run(run(args.turns, args.handshake_ms / 1000))
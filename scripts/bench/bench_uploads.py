@@ -0,0 +1,98 @@
+"""Concurrent upload load test for the trainer API.
+
+Starts the trainer app (services/trainer by default, or --app-dir) under uvicorn
+in a scratch directory, pushes `--clients` concurrent multipart uploads of
+`--size-mb` each to /persona/upload, and meanwhile probes GET /openapi.json to
+measure how long the event loop is stalled for other clients.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+TRAINER_SRC = Path(__file__).resolve().parents[2] / 'services' / 'trainer'
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+async def wait_ready(client: httpx.AsyncClient, url: str, timeout: float = 20.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get(url)).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.1)
+    raise RuntimeError('trainer did not start')
+
+
+async def upload(client: httpx.AsyncClient, base: str, i: int, payload: bytes) -> float:
+    t0 = time.perf_counter()
+    files = {'files': (f'doc-{i}.txt', payload, 'text/plain')}
+    r = await client.post(f'{base}/persona/upload', params={'user_id': f'load{i % 4}'}, files=files)
+    r.raise_for_status()
+    return time.perf_counter() - t0
+
+
+async def probe(client: httpx.AsyncClient, base: str, stop: asyncio.Event, out: list) -> None:
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        await client.get(f'{base}/openapi.json')
+        out.append(time.perf_counter() - t0)
+        await asyncio.sleep(0.02)
+
+
+async def run(base: str, clients: int, size_mb: float) -> None:
+    payload = os.urandom(int(size_mb * 1024 * 1024))
+    async with httpx.AsyncClient(timeout=300, limits=httpx.Limits(max_connections=clients + 2)) as client:
+        await wait_ready(client, f'{base}/openapi.json')
+        stop, probes = asyncio.Event(), []
+        prober = asyncio.create_task(probe(client, base, stop, probes))
+        t0 = time.perf_counter()
+        times = await asyncio.gather(*(upload(client, base, i, payload) for i in range(clients)))
+        wall = time.perf_counter() - t0
+        stop.set()
+        await prober
+    mb = clients * size_mb
+    print(f'{clients} uploads x {size_mb} MB: wall {wall:.2f} s ({mb / wall:.0f} MB/s), '
+          f'upload p50 {statistics.median(times) * 1000:.0f} ms max {max(times) * 1000:.0f} ms')
+    probes.sort()
+    print(f'probe latency during uploads: n={len(probes)} p50 {probes[len(probes) // 2] * 1000:.1f} ms '
+          f'p99 {probes[int(len(probes) * 0.99)] * 1000:.1f} ms max {probes[-1] * 1000:.1f} ms')
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument('--app-dir', default=str(TRAINER_SRC))
+    ap.add_argument('--clients', type=int, default=32)
+    ap.add_argument('--size-mb', type=float, default=8)
+    args = ap.parse_args()
+    port = free_port()
+    with tempfile.TemporaryDirectory() as work:
+        env = {**os.environ, 'ELEVENLABS_API_KEY': 'test', 'DB_URL': f'sqlite:///{work}/bench.db', 'PYTHONPATH': args.app_dir}
+        server = subprocess.Popen([sys.executable, '-m', 'uvicorn', 'api:app', '--port', str(port), '--log-level', 'warning'],
+                                  cwd=work, env=env)
+        try:
+            asyncio.run(run(f'http://127.0.0.1:{port}', args.clients, args.size_mb))
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == '__main__':
+    main()
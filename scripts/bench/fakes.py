@@ -0,0 +1,397 @@
+"""Local stand-ins for the hosted providers and the LiveKit room used by the agent."""
+from __future__ import annotations
+
+import asyncio
+import base64
+import json
+import sys
+import time
+import types
+import uuid
+from pathlib import Path
+from typing import Callable, List, Optional
+
+import numpy as np
+import websockets
+
+AGENT_SRC = Path(__file__).resolve().parents[2] / 'services' / 'agent'
+
+
+def add_agent_to_path() -> None:
+    if str(AGENT_SRC) not in sys.path:
+        sys.path.insert(0, str(AGENT_SRC))
+
+
+class FakeDeepgram:
+    """Deepgram live-listen stand-in.
+
+    Counts received audio and emits an interim transcript every `interim_every`
+    bytes and a final one every `final_every` bytes, each after `delay` seconds,
+    so slow transcription can be simulated without touching the audio path.
+
+    With `endpointing_ms` set, only audio louder than `silence_rms` counts as
+    speech and the final is sent once that much silence follows it (or on a
+    Finalize message), like Deepgram's own endpointing.
+    """
+
+    def __init__(self, interim_every: int = 32000, final_every: int = 160000, delay: float = 0.0,
+                 endpointing_ms: Optional[int] = None, silence_rms: float = 300.0, sample_rate: int = 16000):
+        self.interim_every = interim_every
+        self.final_every = final_every
+        self.delay = delay
+        self.endpointing_ms = endpointing_ms
+        self.silence_rms = silence_rms
+        self.sample_rate = sample_rate
+        self.received = 0
+        self.messages = 0
+        self.finals = 0
+        self.server: Optional[websockets.WebSocketServer] = None
+
+    @property
+    def url(self) -> str:
+        port = self.server.sockets[0].getsockname()[1]
+        return f'ws://127.0.0.1:{port}/v1/listen'
+
+    async def __aenter__(self) -> 'FakeDeepgram':
+        self.server = await websockets.serve(self._handler, '127.0.0.1', 0, max_size=None)
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def _handler(self, ws, path=None) -> None:
+        if self.endpointing_ms is not None:
+            await self._endpointing_handler(ws)
+            return
+        since_interim = since_final = 0
+        words = 0
+        async for msg in ws:
+            if isinstance(msg, str):
+                if json.loads(msg).get('type') == 'CloseStream':
+                    break
+                continue
+            self.received += len(msg)
+            self.messages += 1
+            since_interim += len(msg)
+            since_final += len(msg)
+            if since_interim >= self.interim_every:
+                since_interim = 0
+                words += 1
+                final = since_final >= self.final_every
+                if final:
+                    since_final = 0
+                asyncio.create_task(self._emit(ws, ' '.join(['word'] * words), final))
+                if final:
+                    words = 0
+
+    async def _endpointing_handler(self, ws) -> None:
+        since_interim = 0
+        silence_ms = 0.0
+        words = 0
+        try:
+            async for msg in ws:
+                if isinstance(msg, str):
+                    kind = json.loads(msg).get('type')
+                    if kind == 'CloseStream':
+                        break
+                    if kind == 'Finalize' and words:
+                        self._final(ws, words)
+                        words = since_interim = 0
+                    continue
+                self.received += len(msg)
+                self.messages += 1
+                pcm = np.frombuffer(msg[:len(msg) - len(msg) % 2], dtype=np.int16).astype(np.float32)
+                ms = len(pcm) * 1000 / self.sample_rate
+                if pcm.size and np.sqrt(np.mean(pcm * pcm)) >= self.silence_rms:
+                    silence_ms = 0.0
+                    since_interim += len(msg)
+                    if since_interim >= self.interim_every or not words:
+                        since_interim = 0
+                        words += 1
+                        asyncio.create_task(self._emit(ws, ' '.join(['word'] * words), False))
+                elif words:
+                    silence_ms += ms
+                    if silence_ms >= self.endpointing_ms:
+                        self._final(ws, words)
+                        words = since_interim = 0
+        except websockets.ConnectionClosed:
+            pass
+
+    def _final(self, ws, words: int) -> None:
+        self.finals += 1
+        asyncio.create_task(self._emit(ws, f'question {self.finals} ' + ' '.join(['word'] * words), True))
+
+    async def _emit(self, ws, text: str, final: bool) -> None:
+        await asyncio.sleep(self.delay)
+        payload = {
+            'type': 'Results',
+            'channel': {'alternatives': [{'transcript': text, 'confidence': 0.99}]},
+            'is_final': final,
+            'speech_final': final,
+        }
+        try:
+            await ws.send(json.dumps(payload))
+        except websockets.ConnectionClosed:
+            pass
+
+
+class FakeElevenLabs:
+    """ElevenLabs multi-context stream-input stand-in.
+
+    Accepts connections after `handshake_delay` seconds (standing in for TLS and
+    voice init), answers every flushed text with `bytes_per_char` bytes of PCM
+    per character, and sends `isFinal` once a context is closed.
+    """
+
+    def __init__(self, handshake_delay: float = 0.15, bytes_per_char: int = 640, chunk: int = 3200):
+        self.handshake_delay = handshake_delay
+        self.bytes_per_char = bytes_per_char
+        self.chunk = chunk
+        self.connections = 0
+        self.contexts = 0
+        self.server: Optional[websockets.WebSocketServer] = None
+
+    @property
+    def url(self) -> str:
+        port = self.server.sockets[0].getsockname()[1]
+        return f'ws://127.0.0.1:{port}/v1/text-to-speech/{{voice_id}}/multi-stream-input'
+
+    async def __aenter__(self) -> 'FakeElevenLabs':
+        self.server = await websockets.serve(self._handler, '127.0.0.1', 0, max_size=None)
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def _handler(self, ws, path=None) -> None:
+        await asyncio.sleep(self.handshake_delay)
+        self.connections += 1
+        pending: dict[str, str] = {}
+        try:
+            async for raw in ws:
+                msg = json.loads(raw)
+                ctx = msg.get('context_id', 'default')
+                if ctx not in pending:
+                    pending[ctx] = ''
+                    self.contexts += 1
+                pending[ctx] += msg.get('text', '').strip()
+                if msg.get('flush') or msg.get('close_context'):
+                    await self._audio(ws, ctx, len(pending[ctx]) * self.bytes_per_char)
+                    pending[ctx] = ''
+                if msg.get('close_context'):
+                    await ws.send(json.dumps({'contextId': ctx, 'isFinal': True}))
+                    pending.pop(ctx)
+        except websockets.ConnectionClosed:
+            pass
+
+    async def _audio(self, ws, ctx: str, n: int) -> None:
+        for i in range(0, n, self.chunk):
+            data = base64.b64encode(bytes(min(self.chunk, n - i))).decode()
+            await ws.send(json.dumps({'contextId': ctx, 'audio': data, 'isFinal': None}))
+
+
+class FakeOpenAI:
+    """OpenAI chat completions stand-in (streaming and non-streaming).
+
+    Replies with `reply_words` words; a streamed reply sends its first token
+    after `first_token_delay` seconds and one more every `token_delay` seconds.
+    """
+
+    def __init__(self, first_token_delay: float = 0.3, token_delay: float = 0.02, reply_words: int = 40):
+        self.first_token_delay = first_token_delay
+        self.token_delay = token_delay
+        self.reply_words = reply_words
+        self.requests = 0
+        self.server: Optional[asyncio.AbstractServer] = None
+
+    @property
+    def url(self) -> str:
+        port = self.server.sockets[0].getsockname()[1]
+        return f'http://127.0.0.1:{port}/v1'
+
+    async def __aenter__(self) -> 'FakeOpenAI':
+        self.server = await asyncio.start_server(self._handler, '127.0.0.1', 0)
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        self.server.close()
+        await self.server.wait_closed()
+
+    def _words(self) -> List[str]:
+        sentence = 'this is a generated sentence for the benchmark reply'.split()
+        words = [sentence[i % len(sentence)] for i in range(self.reply_words)]
+        return [w + ('.' if i % len(sentence) == len(sentence) - 1 else '') for i, w in enumerate(words)]
+
+    async def _handler(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                head = await reader.readuntil(b'\r\n\r\n')
+                headers = dict(line.split(': ', 1) for line in head.decode().split('\r\n')[1:] if ': ' in line)
+                length = int({k.lower(): v for k, v in headers.items()}.get('content-length', 0))
+                body = json.loads(await reader.readexactly(length)) if length else {}
+                self.requests += 1
+                if body.get('stream'):
+                    await self._stream(writer, body)
+                else:
+                    await self._complete(writer, body)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _complete(self, writer: asyncio.StreamWriter, body: dict) -> None:
+        await asyncio.sleep(self.first_token_delay + self.token_delay * self.reply_words)
+        payload = json.dumps({
+            'id': f'chatcmpl-{uuid.uuid4().hex}', 'object': 'chat.completion', 'created': int(time.time()),
+            'model': body.get('model', 'fake'),
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': ' '.join(self._words())}, 'finish_reason': 'stop'}],
+            'usage': {'prompt_tokens': 0, 'completion_tokens': self.reply_words, 'total_tokens': self.reply_words},
+        }).encode()
+        writer.write(b'HTTP/1.1 200 OK\r\ncontent-type: application/json\r\n'
+                     + f'content-length: {len(payload)}\r\n\r\n'.encode() + payload)
+        await writer.drain()
+
+    async def _stream(self, writer: asyncio.StreamWriter, body: dict) -> None:
+        writer.write(b'HTTP/1.1 200 OK\r\ncontent-type: text/event-stream\r\ntransfer-encoding: chunked\r\n\r\n')
+        chunk_id = f'chatcmpl-{uuid.uuid4().hex}'
+
+        async def event(delta: dict, finish: Optional[str] = None) -> None:
+            data = json.dumps({'id': chunk_id, 'object': 'chat.completion.chunk', 'created': int(time.time()),
+                               'model': body.get('model', 'fake'),
+                               'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish}]})
+            await self._chunk(writer, f'data: {data}\n\n'.encode())
+
+        await asyncio.sleep(self.first_token_delay)
+        for i, word in enumerate(self._words()):
+            if i:
+                await asyncio.sleep(self.token_delay)
+            await event({'content': word if i == 0 else ' ' + word})
+        await event({}, 'stop')
+        await self._chunk(writer, b'data: [DONE]\n\n')
+        await self._chunk(writer, b'')
+
+    @staticmethod
+    async def _chunk(writer: asyncio.StreamWriter, data: bytes) -> None:
+        writer.write(f'{len(data):x}\r\n'.encode() + data + b'\r\n')
+        await writer.drain()
+
+
+class FakeAudioFrame:
+    def __init__(self, data: bytes, sample_rate: int, num_channels: int, samples_per_channel: int):
+        self.data = data
+        self.sample_rate = sample_rate
+        self.num_channels = num_channels
+        self.samples_per_channel = samples_per_channel
+
+
+class FakeAudioSource:
+    """Plays captured frames out in real time behind a `queue_size_ms` buffer, as
+    rtc.AudioSource does, and records when each frame was captured."""
+
+    def __init__(self, sample_rate: int, num_channels: int, queue_size_ms: int = 1000):
+        self.sample_rate = sample_rate
+        self.num_channels = num_channels
+        self.queue_s = queue_size_ms / 1000
+        self.play_until = 0.0
+        self.captured: List[float] = []
+
+    async def capture_frame(self, frame: FakeAudioFrame) -> None:
+        now = time.perf_counter()
+        self.captured.append(now)
+        self.play_until = max(now, self.play_until) + frame.samples_per_channel / self.sample_rate
+        if self.play_until - now > self.queue_s:
+            await asyncio.sleep(self.play_until - now - self.queue_s)
+
+    def clear_queue(self) -> None:
+        self.play_until = time.perf_counter()
+
+
+class FakeLocalAudioTrack:
+    def __init__(self, name: str, source: FakeAudioSource):
+        self.name = name
+        self.source = source
+
+    @classmethod
+    def create_audio_track(cls, name: str, source: FakeAudioSource) -> 'FakeLocalAudioTrack':
+        return cls(name, source)
+
+
+class FakeRemoteAudioTrack:
+    """A participant's microphone track; play() replays PCM into the frame callbacks at real-time pace."""
+
+    def __init__(self, sample_rate: int = 16000, frame_ms: int = 20):
+        self.sample_rate = sample_rate
+        self.frame_ms = frame_ms
+        self.callbacks: List[Callable] = []
+
+    def add_audio_frame_received(self, callback: Callable) -> None:
+        self.callbacks.append(callback)
+
+    async def play(self, pcm: bytes, speed: float = 1.0, on_frame: Optional[Callable[[int, float], None]] = None) -> None:
+        frame_bytes = self.sample_rate * self.frame_ms // 1000 * 2
+        period = self.frame_ms / 1000 / speed
+        start = time.perf_counter()
+        for i, off in enumerate(range(0, len(pcm) - frame_bytes + 1, frame_bytes)):
+            frame = FakeAudioFrame(pcm[off:off + frame_bytes], self.sample_rate, 1, frame_bytes // 2)
+            for cb in self.callbacks:
+                cb(frame)
+            if on_frame:
+                on_frame(off + frame_bytes, time.perf_counter())
+            delay = start + (i + 1) * period - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+
+class FakeLocalParticipant:
+    def __init__(self):
+        self.tracks: List[FakeLocalAudioTrack] = []
+
+    async def publish_track(self, track: FakeLocalAudioTrack, options=None) -> None:
+        self.tracks.append(track)
+
+
+class FakeRoom:
+    """In-process stand-in for rtc.Room: records handlers and published tracks."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.handlers: dict[str, List[Callable]] = {}
+        self.local_participant = FakeLocalParticipant()
+
+    def on(self, event: str, callback: Callable) -> None:
+        self.handlers.setdefault(event, []).append(callback)
+
+    def emit(self, event: str, *args) -> None:
+        for cb in self.handlers.get(event, []):
+            cb(*args)
+
+    async def subscribe(self, track: FakeRemoteAudioTrack, timeout: float = 60.0) -> None:
+        """Wait for the agent to register for tracks, then hand it `track`."""
+        deadline = time.perf_counter() + timeout
+        while 'track_subscribed' not in self.handlers:
+            if time.perf_counter() > deadline:
+                raise TimeoutError(f'{self.name}: agent never subscribed to tracks')
+            await asyncio.sleep(0.01)
+        self.emit('track_subscribed', types.SimpleNamespace(track=track), None)
+
+    async def disconnect(self) -> None:
+        self.emit('disconnected')
+
+
+def install_fake_livekit() -> types.ModuleType:
+    """Register `livekit.rtc` backed by the fakes above, so the agent runs against FakeRoom."""
+    rtc = types.ModuleType('livekit.rtc')
+    rtc.Room = FakeRoom
+    rtc.RemoteAudioTrack = FakeRemoteAudioTrack
+    rtc.LocalAudioTrack = FakeLocalAudioTrack
+    rtc.AudioSource = FakeAudioSource
+    rtc.AudioFrame = FakeAudioFrame
+    rtc.TrackPublishOptions = lambda **kw: types.SimpleNamespace(**kw)
+    rtc.TrackSource = types.SimpleNamespace(SOURCE_MICROPHONE='microphone')
+    livekit = types.ModuleType('livekit')
+    livekit.rtc = rtc
+    sys.modules['livekit'] = livekit
+    sys.modules['livekit.rtc'] = rtc
+    return rtc
@@ -5,12 +5,13 @@ from __future__ import annotations
 import argparse
 import os
 import sys
+import time
 from pathlib import Path
 from typing import Iterable, List
 
 import requests
 
-SUPPORTED_SUFFIXES = {'.pdf', '.txt', '.md'}
+SUPPORTED_SUFFIXES = {'.pdf', '.txt', '.md', '.docx', '.pptx', '.html', '.htm', '.rtf', '.odt', '.epub'}
 DEFAULT_TRAINER_URL = os.getenv('TRAINER_API_URL', 'http://localhost:8090')
 
 
@@ -34,10 +35,11 @@ def friendly_size(path: Path) -> str:
     return f"{size:.1f}TB"
 
 
-def reindex_persona(user_id: str, trainer_url: str, show_log: bool = False) -> bool:
-    url = f"{trainer_url.rstrip('/')}/persona/reindex"
+def reindex_persona(user_id: str, trainer_url: str, show_log: bool = False, full: bool = False,
+                    timeout: float = 1800, poll_interval: float = 2.0) -> bool:
+    base = trainer_url.rstrip('/')
     try:
-        resp = requests.post(url, params={'user_id': user_id}, timeout=120)
+        resp = requests.post(f'{base}/persona/reindex', params={'user_id': user_id, 'full': full}, timeout=10)
         resp.raise_for_status()
     except requests.ConnectionError:
         print('✗ Cannot reach trainer API. Start it with `docker compose up trainer`.')
@@ -46,13 +48,37 @@ def reindex_persona(user_id: str, trainer_url: str, show_log: bool = False) -> b
         print(f'✗ Reindex request failed: {exc}')
         return False
 
-    data = resp.json()
+    job_id = resp.json()['job_id']
+    print(f"… Reindex job {job_id} {'merged into a queued build' if resp.json().get('merged') else 'queued'}.")
+    deadline = time.monotonic() + timeout
+    state = None
+    while time.monotonic() < deadline:
+        try:
+            job = requests.get(f'{base}/persona/jobs/{job_id}', params={'log': show_log}, timeout=10).json()
+        except requests.RequestException as exc:
+            print(f'  (status check failed: {exc}; retrying)')
+            time.sleep(poll_interval)
+            continue
+        if job['state'] != state:
+            state = job['state']
+            print(f'  - {state}')
+        if state in {'done', 'failed'}:
+            break
+        time.sleep(poll_interval)
+    else:
+        print(f'✗ Gave up waiting after {timeout:.0f}s; check GET /persona/jobs/{job_id}.')
+        return False
+
+    if state == 'failed':
+        print(f"✗ Indexing failed: {job.get('error')}")
+        return False
     print('✓ Persona index rebuilt.')
-    print(f"  - Backend: {data.get('backend', 'faiss')}")
-    print(f"  - Index path: {data.get('index_path', f'data/indexes/{user_id}')}" )
+    print(f"  - Version: {job.get('version')}")
+    print(f"  - Index path: {resp.json().get('index_path', f'data/indexes/{user_id}')}")
+    print(f"  - Took: {job['finished'] - job['started']:.1f}s")
     if show_log:
         print('\n--- Index Log ---')
-        print(data.get('log', '').strip())
+        print(job.get('log', '').strip())
         print('-----------------')
     return True
 
@@ -64,6 +90,8 @@ def main(argv: List[str]) -> int:
     parser.add_argument('--reindex', action='store_true', help='Trigger indexing immediately without prompting.')
     parser.add_argument('--show-log', action='store_true', help='Print indexing log returned by the trainer service.')
     parser.add_argument('--non-interactive', action='store_true', help='Do not ask for confirmation before reindexing.')
+    parser.add_argument('--full', action='store_true', help='Rebuild the index from scratch instead of incrementally.')
+    parser.add_argument('--timeout', type=float, default=1800, help='Seconds to wait for the reindex job (default: %(default)s).')
     args = parser.parse_args(argv)
 
     persona_dir = ensure_persona_dir(args.user_id)
@@ -79,7 +107,7 @@ def main(argv: List[str]) -> int:
 
     should_reindex = args.reindex or (docs and not args.non_interactive and _prompt('Reindex now? [y/N] '))
     if should_reindex:
-        reindex_persona(args.user_id, args.trainer_url, args.show_log)
+        reindex_persona(args.user_id, args.trainer_url, args.show_log, args.full, args.timeout)
     else:
         if not docs:
             print('\nNext steps: populate the directory then re-run with --reindex to build embeddings.')
@@ -34,7 +34,7 @@ def check_api_health(api_url: str) -> CheckResult:
 
 
 def check_token(api_url: str, user_id: str, room_name: str) -> CheckResult:
-    payload = {'identity': user_id, 'name': room_name}
+    payload = {'identity': user_id, 'room': room_name, 'name': user_id}
     try:
         resp = requests.post(f"{api_url}/token", json=payload, timeout=10)
         if resp.status_code != 200:
@@ -0,0 +1,36 @@
+import asyncio
+
+class PcmRingBuffer:
+    def __init__(self, sample_rate=16000, chunk_ms=60, capacity_ms=2000, sample_width=2, channels=1):
+        self.chunk_ms=min(100, max(40, chunk_ms)); self.frame_bytes=sample_width*channels
+        self.chunk_bytes=sample_rate*self.chunk_ms//1000*self.frame_bytes
+        chunks=max(2, -(-capacity_ms//self.chunk_ms)); self.capacity=chunks*self.chunk_bytes
+        self.buf=bytearray(self.capacity); self.view=memoryview(self.buf)
+        self.read_pos=0; self.size=0; self._ready=asyncio.Event()
+        self.frames_in=0; self.chunks_out=0; self.dropped_bytes=0; self.overflows=0
+    def write(self, data):
+        mv=memoryview(data).cast('B'); n=len(mv); self.frames_in+=1
+        if n>self.capacity: self.dropped_bytes+=n-self.capacity; mv=mv[n-self.capacity:]; n=self.capacity
+        overflow=self.size+n-self.capacity
+        if overflow>0:
+            overflow+=-overflow%self.frame_bytes; self.overflows+=1; self.dropped_bytes+=overflow
+            self.read_pos=(self.read_pos+overflow)%self.capacity; self.size-=overflow
+        wp=(self.read_pos+self.size)%self.capacity; first=min(n, self.capacity-wp)
+        self.view[wp:wp+first]=mv[:first]
+        if first<n: self.view[:n-first]=mv[first:]
+        self.size+=n
+        if self.size>=self.chunk_bytes: self._ready.set()
+    def _take(self, n) -> bytes:
+        rp=self.read_pos; end=rp+n
+        out=bytes(self.view[rp:end]) if end<=self.capacity else bytes(self.view[rp:])+bytes(self.view[:end-self.capacity])
+        self.read_pos=end%self.capacity; self.size-=n; self.chunks_out+=1
+        return out
+    async def read_chunk(self) -> bytes:
+        while self.size<self.chunk_bytes:
+            self._ready.clear(); await self._ready.wait()
+        return self._take(self.chunk_bytes)
+    def drain(self) -> bytes:
+        return self._take(self.size) if self.size else b''
+    def stats(self) -> dict:
+        return {'frames_in':self.frames_in,'chunks_out':self.chunks_out,'buffered_ms':self.size*self.chunk_ms//self.chunk_bytes,
+                'dropped_ms':self.dropped_bytes*self.chunk_ms//self.chunk_bytes,'overflows':self.overflows}
@@ -7,7 +7,17 @@ class Settings(BaseSettings):
     DEEPGRAM_API_KEY: str
     ELEVENLABS_API_KEY: str
     DB_URL: str = 'sqlite:///./memory.db'
+    API_URL: str = 'http://api:8080'
+    DEEPGRAM_URL: str = 'wss://api.deepgram.com/v1/listen'
+    OPENAI_BASE_URL: str | None = None
     RAG_BACKEND: str = 'faiss'
+    RAG_NPROBE: int = 16
+    RAG_EF_SEARCH: int = 64
+    RAG_RERANK_FACTOR: int = 8
+    RAG_SPECULATE_MIN_WORDS: int = 3
+    RAG_SPECULATE_MATCH: float = 0.85
+    RAG_RELOAD_POLL_S: float = 5.0
+    RAG_SHARED_INDEX: str | None = None
     PINECONE_API_KEY: str | None = None
     PINECONE_ENV: str | None = None
     PINECONE_INDEX: str | None = None
@@ -15,7 +25,24 @@ class Settings(BaseSettings):
     AGENT_VOICE_PROVIDER: str = 'elevenlabs'
     AGENT_VOICE_ID: str | None = None
     DEFAULT_VOICE_ID: str = 'Rachel'
+    AGENT_GREETING: str = 'Hello! I’m ready. Start speaking whenever you like.'
     HISTORY_RELOAD_TURNS: int = 12
+    CONTEXT_TOKEN_BUDGET: int = 3000
+    CONTEXT_REPLY_TOKENS: int = 300
+    CONTEXT_KEEP_TURNS: int = 6
+    CONTEXT_SUMMARY_WORDS: int = 150
+    DEMO_USER_ID: str | None = 'joyce'
+    AGENT_PORT: int = 8081
+    AGENT_SHARDS: int = 0
+    AGENT_MAX_SESSIONS: int = 8
+    AGENT_MAX_LOAD: float = 0.85
+    AUDIO_SAMPLE_RATE: int = 16000
+    AUDIO_CHUNK_MS: int = 60
+    AUDIO_BUFFER_MS: int = 2000
+    VAD_ENABLED: bool = True
+    VAD_THRESHOLD: float = 0.5
+    VAD_PREROLL_MS: int = 300
+    VAD_HANGOVER_MS: int = 600
     class Config:
         env_file = '.env'
 settings = Settings()
@@ -0,0 +1,146 @@
+import asyncio, multiprocessing as mp, os, queue, threading, time, traceback
+from dataclasses import dataclass, field
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel
+from metrics import Metrics, metrics
+
+def cpu_load() -> float:
+    try: return os.getloadavg()[0]/(os.cpu_count() or 1)
+    except OSError: return 0.0
+
+@dataclass
+class Session:
+    room: str
+    user_id: str
+    started: float = field(default_factory=time.time)
+    state: str = 'starting'
+    error: str | None = None
+    task: asyncio.Task | None = None
+    def info(self) -> dict:
+        return {'room':self.room,'user_id':self.user_id,'state':self.state,'age_s':round(time.time()-self.started,1),'error':self.error}
+
+class SessionTable:
+    def __init__(self):
+        self.sessions: dict[str, Session] = {}; self.completed=0; self.failed=0
+    def active(self) -> int:
+        return sum(1 for s in self.sessions.values() if s.state in ('starting','running'))
+    def snapshot(self) -> dict:
+        return {'active':self.active(),'completed':self.completed,'failed':self.failed,'sessions':[s.info() for s in self.sessions.values()]}
+
+class Shard:
+    def __init__(self, shard_id: int, commands, status, max_sessions: int):
+        self.shard_id=shard_id; self.commands=commands; self.status=status; self.max_sessions=max_sessions; self.table=SessionTable()
+    async def run(self):
+        import worker
+        await worker.warm_up()
+        beat=asyncio.create_task(self._heartbeat())
+        try:
+            while True:
+                cmd=await asyncio.to_thread(self.commands.get)
+                if cmd[0]=='assign': self.assign(worker, *cmd[1:])
+                elif cmd[0]=='stop': self.stop(cmd[1])
+                elif cmd[0]=='shutdown': break
+        finally:
+            beat.cancel()
+            for s in list(self.table.sessions.values()): self.stop(s.room)
+            await asyncio.gather(*(s.task for s in self.table.sessions.values() if s.task), return_exceptions=True)
+            await worker.shutdown(); self._report()
+    def assign(self, worker, room: str, user_id: str):
+        if room in self.table.sessions or self.table.active()>=self.max_sessions: return
+        s=self.table.sessions[room]=Session(room, user_id); s.task=asyncio.create_task(self._session(worker, s)); self._report()
+    def stop(self, room: str):
+        s=self.table.sessions.get(room)
+        if s and s.task and not s.task.done(): s.state='stopping'; s.task.cancel()
+    async def _session(self, worker, s: Session):
+        try:
+            s.state='running'; await worker.run_session(s.room, s.user_id); s.state='done'; self.table.completed+=1
+        except asyncio.CancelledError:
+            s.state='stopped'; self.table.completed+=1
+        except Exception as e:
+            s.state='failed'; s.error=repr(e); self.table.failed+=1; traceback.print_exc()
+        finally:
+            self.table.sessions.pop(s.room, None); self._report()
+    def _report(self):
+        self.status.put({'shard':self.shard_id,'pid':os.getpid(),'ts':time.time(),'load':cpu_load(),**self.table.snapshot(),'metrics':metrics.export()})
+    async def _heartbeat(self, every_s=2.0):
+        while True: self._report(); await asyncio.sleep(every_s)
+
+def shard_main(shard_id, commands, status, max_sessions):
+    asyncio.run(Shard(shard_id, commands, status, max_sessions).run())
+
+class Assignment(BaseModel):
+    room: str
+    user_id: str
+
+class Dispatcher:
+    def __init__(self, shards: int, max_sessions: int, max_load: float, stale_s=10.0):
+        self.n=shards; self.max_sessions=max_sessions; self.max_load=max_load; self.stale_s=stale_s
+        ctx=mp.get_context('spawn'); self.status=ctx.Queue(); self.commands=[ctx.Queue() for _ in range(shards)]
+        self.procs=[ctx.Process(target=shard_main, args=(i, self.commands[i], self.status, max_sessions), daemon=True) for i in range(shards)]
+        self.shards: dict[int, dict] = {}; self.rooms: dict[str, int] = {}; self.pending: dict[str, float] = {}
+        self.lock=threading.Lock(); self.rejected=0
+    def start(self):
+        for p in self.procs: p.start()
+        threading.Thread(target=self._drain_status, daemon=True).start()
+    def _drain_status(self):
+        while True:
+            try: st=self.status.get(timeout=1.0)
+            except queue.Empty: continue
+            live={s['room'] for s in st['sessions']}
+            with self.lock:
+                self.shards[st['shard']]=st
+                for room,shard in list(self.rooms.items()):
+                    if shard!=st['shard']: continue
+                    if room in live: self.pending.pop(room, None)
+                    elif time.time()-self.pending.get(room, 0)>self.stale_s: self.rooms.pop(room); self.pending.pop(room, None)
+    def healthy(self, i: int) -> bool:
+        st=self.shards.get(i); return bool(st) and self.procs[i].is_alive() and time.time()-st['ts']<self.stale_s
+    def assign(self, room: str, user_id: str) -> int:
+        with self.lock:
+            if room in self.rooms: return self.rooms[room]
+            if cpu_load()>self.max_load: self.rejected+=1; raise HTTPException(503, f'CPU load {cpu_load():.2f} above {self.max_load}')
+            load={i: self.shards[i]['active']+sum(1 for r in self.pending if self.rooms.get(r)==i) for i in range(self.n) if self.healthy(i)}
+            free={i:n for i,n in load.items() if n<self.max_sessions}
+            if not free: self.rejected+=1; raise HTTPException(503, 'No shard has session capacity')
+            shard=min(free, key=free.get); self.rooms[room]=shard; self.pending[room]=time.time()
+        self.commands[shard].put(('assign', room, user_id)); return shard
+    def release(self, room: str) -> bool:
+        with self.lock: shard=self.rooms.pop(room, None); self.pending.pop(room, None)
+        if shard is None: return False
+        self.commands[shard].put(('stop', room)); return True
+    def health(self) -> dict:
+        with self.lock:
+            shards=[{**{k:v for k,v in self.shards.get(i, {'shard':i}).items() if k!='metrics'}, 'alive':self.procs[i].is_alive(), 'healthy':self.healthy(i)} for i in range(self.n)]
+        return {'ok':all(s['healthy'] for s in shards), 'load':cpu_load(), 'rejected':self.rejected,
+                'active':sum(s.get('active',0) for s in shards), 'capacity':self.n*self.max_sessions, 'shards':shards}
+    def metrics(self) -> str:
+        """Stage latency histograms merged across shards, plus dispatcher gauges, in Prometheus text format."""
+        merged=Metrics('agent'); health=self.health()
+        with self.lock: exports=[st['metrics'] for st in self.shards.values() if 'metrics' in st]
+        for e in exports: merged.merge(e)
+        gauges={'sessions_active':health['active'],'session_capacity':health['capacity'],'cpu_load':round(health['load'], 3),
+                'shards_healthy':sum(s['healthy'] for s in health['shards'])}
+        lines=[f'# TYPE agent_{k} gauge\nagent_{k} {v}' for k,v in gauges.items()]
+        lines.append(f'# TYPE agent_rejected_total counter\nagent_rejected_total {self.rejected}')
+        return merged.render()+'\n'.join(lines)+'\n'
+    def shutdown(self, timeout=15.0):
+        for q in self.commands: q.put(('shutdown',))
+        for p in self.procs: p.join(timeout)
+
+def create_app(dispatcher: Dispatcher) -> FastAPI:
+    app=FastAPI(title='Agent Dispatcher')
+    @app.get('/health')
+    def health():
+        return dispatcher.health()
+    @app.get('/metrics', response_class=PlainTextResponse)
+    def metrics():
+        return dispatcher.metrics()
+    @app.post('/rooms')
+    def assign(req: Assignment):
+        return {'ok': True, 'room': req.room, 'shard': dispatcher.assign(req.room, req.user_id)}
+    @app.delete('/rooms/{room}')
+    def release(room: str):
+        if not dispatcher.release(room): raise HTTPException(404, 'room not assigned')
+        return {'ok': True}
+    return app
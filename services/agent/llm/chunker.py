@@ -0,0 +1,23 @@
+import re
+SENTENCE_END=re.compile(r'[.!?…。！？]+["”’)\]]*\s')
+CLAUSE_END=re.compile(r'[,;:—，；：]\s')
+
+async def sentence_chunks(tokens, min_chars=24, max_chars=160):
+    buf=''
+    async for tok in tokens:
+        buf+=tok
+        while True:
+            cut=_cut(buf, min_chars, max_chars)
+            if cut is None: break
+            piece, buf = buf[:cut].strip(), buf[cut:]
+            if piece: yield piece
+    if buf.strip(): yield buf.strip()
+
+def _cut(buf, min_chars, max_chars):
+    for m in SENTENCE_END.finditer(buf):
+        if m.end()>=min_chars: return m.end()
+    if len(buf)<max_chars: return None
+    clauses=[m.end() for m in CLAUSE_END.finditer(buf, 0, max_chars) if m.end()>=min_chars]
+    if clauses: return clauses[-1]
+    space=buf.rfind(' ', min_chars, max_chars)
+    return space+1 if space>0 else max_chars
@@ -0,0 +1,85 @@
+import asyncio, time
+try:
+    import tiktoken
+except ImportError:
+    tiktoken=None
+
+class TokenCounter:
+    def __init__(self, model='gpt-4o-mini'):
+        self.enc=None
+        if tiktoken is not None:
+            try: self.enc=tiktoken.encoding_for_model(model)
+            except KeyError: self.enc=tiktoken.get_encoding('o200k_base')
+    def count(self, text: str) -> int:
+        return len(self.enc.encode(text)) if self.enc else len(text)//4+1
+    def message(self, m: dict) -> int:
+        return 4+self.count(m['content'])
+    def truncate(self, text: str, n: int) -> str:
+        """Longest prefix of `text` within n tokens."""
+        if n<=0: return ''
+        if self.enc: return self.enc.decode(self.enc.encode(text)[:n])
+        return text if self.count(text)<=n else text[:(n-1)*4]
+
+SUMMARY_PROMPT=('You maintain the running summary of a voice conversation between a user and an assistant. '
+                'Merge the new turns into the existing summary. Keep names, facts, preferences, commitments and open questions; '
+                'drop small talk. Reply with the summary only, at most {words} words.')
+
+class ConversationContext:
+    """Rolling prompt window kept under a token budget.
+
+    Turns older than the most recent `keep_recent` are folded into a running summary by a
+    background LLM call once the window passes the budget; build() trims the oldest turns
+    from the prompt it returns if a fold has not landed yet, so a turn never waits on it.
+    """
+    def __init__(self, system: str, llm, budget=3000, reserve=300, keep_recent=6, summary_words=150, counter=None):
+        self.system={'role':'system','content':system}; self.llm=llm; self.budget=budget; self.reserve=reserve
+        self.keep_recent=keep_recent; self.summary_words=summary_words; self.counter=counter or TokenCounter(llm.model)
+        self.turns: list[dict] = []; self.summary=''; self.task=None
+        self.stats={'turns':0,'summaries':0,'folded':0,'summary_s':0.0,'summary_errors':0,'trimmed':0,'background_cut':0,
+                    'prompts':0,'prompt_tokens':0,'prompt_last':0,'prompt_max':0}
+    def _tokens(self, msgs) -> int:
+        return sum(self.counter.message(m) for m in msgs)
+    def _head(self) -> list[dict]:
+        return [self.system]+([{'role':'system','content':f'Summary of the earlier conversation:\n{self.summary}'}] if self.summary else [])
+    def add(self, role: str, content: str):
+        self.turns.append({'role':role,'content':content}); self.stats['turns']+=1; self._maybe_fold()
+    def extend(self, history):
+        for role, content in history: self.turns.append({'role':role,'content':content})
+        self._maybe_fold()
+    def _maybe_fold(self):
+        if self.task and not self.task.done(): return
+        if len(self.turns)<=self.keep_recent or self._tokens(self._head()+self.turns)<=self.budget-self.reserve: return
+        self.task=asyncio.create_task(self._fold())
+    async def _fold(self):
+        n=len(self.turns)-self.keep_recent; batch=self.turns[:n]; t0=time.perf_counter()
+        transcript='\n'.join(f"{m['role']}: {m['content']}" for m in batch)
+        prompt=[{'role':'system','content':SUMMARY_PROMPT.format(words=self.summary_words)},
+                {'role':'user','content':f'Existing summary:\n{self.summary or "(none)"}\n\nNew turns:\n{transcript}'}]
+        try:
+            summary=await self.llm.acomplete(prompt, max_tokens=self.summary_words*2)
+        except Exception as e:
+            self.stats['summary_errors']+=1; print(f'Context summary failed: {e!r}'); return
+        del self.turns[:n]; self.summary=summary
+        self.stats['summaries']+=1; self.stats['folded']+=n; self.stats['summary_s']+=time.perf_counter()-t0
+        self._maybe_fold()
+    def build(self, extra: list[dict], background: dict | None = None) -> list[dict]:
+        """head + as many recent turns as fit + extra + background. `background` (retrieved context) is cut to the
+        room left after head and extra, and takes precedence over history."""
+        head=self._head(); room=self.budget-self.reserve-self._tokens(head)-self._tokens(extra); start=len(self.turns)
+        if background:
+            content=self.counter.truncate(background['content'], room-self.counter.message({'content':''}))
+            if content!=background['content']: self.stats['background_cut']+=1
+            background={**background, 'content':content} if content else None
+            if background: room-=self.counter.message(background)
+        while start>0 and self.counter.message(self.turns[start-1])<=room:
+            start-=1; room-=self.counter.message(self.turns[start])
+        prompt=head+self.turns[start:]+extra+([background] if background else []); tokens=self._tokens(prompt)
+        self.stats['trimmed']+=start; self.stats['prompts']+=1; self.stats['prompt_tokens']+=tokens
+        self.stats['prompt_last']=tokens; self.stats['prompt_max']=max(self.stats['prompt_max'], tokens)
+        return prompt
+    def snapshot(self) -> dict:
+        return {**self.stats, 'prompt_avg': self.stats['prompt_tokens']/self.stats['prompts'] if self.stats['prompts'] else 0.0,
+                'window_turns':len(self.turns), 'summary_tokens':self.counter.count(self.summary) if self.summary else 0,
+                'tokenizer':'tiktoken' if self.counter.enc else 'chars/4'}
+    def close(self):
+        if self.task and not self.task.done(): self.task.cancel()
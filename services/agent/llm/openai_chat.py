@@ -1,7 +1,23 @@
-from openai import OpenAI
+import time
+from openai import OpenAI, AsyncOpenAI
+from metrics import metrics
 class ChatLLM:
-    def __init__(self, api_key: str, model='gpt-4o-mini'):
-        self.client = OpenAI(api_key=api_key); self.model=model
+    def __init__(self, api_key: str, model='gpt-4o-mini', base_url=None):
+        self.client = OpenAI(api_key=api_key, base_url=base_url); self.aclient = AsyncOpenAI(api_key=api_key, base_url=base_url); self.model=model
     def complete(self, messages, max_tokens=300):
         r = self.client.chat.completions.create(model=self.model, messages=messages, temperature=0.6, max_tokens=max_tokens, stream=False)
         return r.choices[0].message.content.strip()
+    async def acomplete(self, messages, max_tokens=300):
+        with metrics.span('llm_complete'):
+            r = await self.aclient.chat.completions.create(model=self.model, messages=messages, temperature=0.3, max_tokens=max_tokens, stream=False)
+        return r.choices[0].message.content.strip()
+    async def stream(self, messages, max_tokens=300):
+        t0=time.perf_counter(); first=True
+        r = await self.aclient.chat.completions.create(model=self.model, messages=messages, temperature=0.6, max_tokens=max_tokens, stream=True)
+        try:
+            async for chunk in r:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    if first: metrics.observe('llm_first_token', (time.perf_counter()-t0)*1000); first=False
+                    yield chunk.choices[0].delta.content
+        finally:
+            await r.close(); metrics.observe('llm_stream', (time.perf_counter()-t0)*1000)
@@ -0,0 +1,90 @@
+import datetime as dt, gzip, json, os, time
+from pathlib import Path
+from sqlalchemy import text
+from .backend import PARTITION_DAYS, SQLITE, engine, ensure_partitions
+COLUMNS=('room','seq','role','content','ts')
+
+def _ts(v):
+    return f'{v:%Y-%m-%d %H:%M:%S.%f}' if isinstance(v, dt.datetime) else v
+
+def _row(r) -> dict:
+    row=dict(zip(COLUMNS, r))
+    if isinstance(row['ts'], str): row['ts']=dt.datetime.fromisoformat(row['ts'])
+    return row
+
+def iter_batches(since=None, until=None, room=None, batch=5000):
+    """chat_log rows in ts order through a server-side cursor, `batch` rows at a time, so memory stays flat at any table size."""
+    where=[c for c,v in (('ts>=:since',since),('ts<:until',until),('room=:room',room)) if v is not None]
+    sql='SELECT room,seq,role,content,ts FROM chat_log'+(' WHERE '+' AND '.join(where) if where else '')+' ORDER BY ts'
+    with engine.connect() as conn:
+        result=conn.execution_options(stream_results=True, yield_per=batch).execute(text(sql), {'since':_ts(since),'until':_ts(until),'room':room})
+        for rows in result.partitions(): yield [_row(r) for r in rows]
+
+def write_jsonl(path, batches) -> int:
+    n=0
+    with gzip.open(path, 'wt', encoding='utf-8') as f:
+        for rows in batches:
+            f.writelines(json.dumps({**r, 'ts':r['ts'].isoformat()}, ensure_ascii=False)+'\n' for r in rows); n+=len(rows)
+    return n
+
+def write_parquet(path, batches) -> int:
+    try:
+        import pyarrow as pa, pyarrow.parquet as pq
+    except ImportError as e:
+        raise RuntimeError('Parquet export needs pyarrow installed') from e
+    schema=pa.schema([('room',pa.string()),('seq',pa.int64()),('role',pa.string()),('content',pa.string()),('ts',pa.timestamp('us'))]); n=0
+    with pq.ParquetWriter(path, schema, compression='zstd') as w:
+        for rows in batches: w.write_table(pa.Table.from_pylist(rows, schema=schema)); n+=len(rows)
+    return n
+
+WRITERS={'jsonl':(write_jsonl, '.jsonl.gz'), 'parquet':(write_parquet, '.parquet')}
+
+def export(path, fmt='jsonl', batch=5000, **filters) -> int:
+    """Write matching rows to `path` (gzip JSONL or Parquet), renamed into place only once complete."""
+    tmp=f'{path}.tmp'
+    try:
+        n=WRITERS[fmt][0](tmp, iter_batches(batch=batch, **filters)); os.replace(tmp, path); return n
+    finally:
+        if os.path.exists(tmp): os.remove(tmp)
+
+def expired_partitions(conn, before: dt.datetime) -> list[str]:
+    rows=conn.execute(text("SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid=i.inhrelid WHERE i.inhparent='chat_log'::regclass")).scalars()
+    return [name for name in rows if name.startswith('chat_log_p')
+            and dt.datetime.strptime(name[10:], '%Y%m%d')+dt.timedelta(days=PARTITION_DAYS)<=before]
+
+def archive(before: dt.datetime, out_dir, fmt='jsonl', batch=5000, compact=False) -> dict:
+    """Move turns older than `before` into one archive file, then drop whole expired partitions and delete the rest in batches.
+
+    chat_rooms is left alone, so a room's seq keeps counting up after its old turns are archived.
+    """
+    t0=time.perf_counter(); out_dir=Path(out_dir); out_dir.mkdir(parents=True, exist_ok=True)
+    path=out_dir/f'chat_log-{before:%Y%m%dT%H%M%S}{WRITERS[fmt][1]}'
+    archived=export(path, fmt, batch, until=before)
+    if not archived: path.unlink()
+    with engine.begin() as conn:
+        ensure_partitions(conn); dropped=expired_partitions(conn, before) if PARTITION_DAYS else []
+        for name in dropped: conn.execute(text(f'DROP TABLE {name}'))
+    deleted=0
+    while True:
+        with engine.begin() as conn:
+            n=conn.execute(text('DELETE FROM chat_log WHERE (room, seq) IN (SELECT room, seq FROM chat_log WHERE ts<:b LIMIT :n)'), {'b':_ts(before),'n':batch}).rowcount
+        deleted+=n
+        if n<batch: break
+    if compact:
+        with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn: conn.execute(text('VACUUM' if SQLITE else 'VACUUM (ANALYZE) chat_log'))
+    return {'archived':archived, 'path':str(path) if archived else None, 'dropped_partitions':dropped, 'deleted':deleted, 'secs':round(time.perf_counter()-t0, 2)}
+
+if __name__=='__main__':
+    import argparse
+    ap=argparse.ArgumentParser(description='chat_log retention and bulk export.'); sub=ap.add_subparsers(dest='cmd', required=True)
+    a=sub.add_parser('archive', help='archive and remove turns older than --retain-days')
+    a.add_argument('--retain-days', type=float, default=float(os.getenv('CHAT_RETAIN_DAYS','90'))); a.add_argument('--out', default=os.getenv('CHAT_ARCHIVE_DIR','data/archive'))
+    a.add_argument('--compact', action='store_true', help='VACUUM afterwards to return the freed space')
+    e=sub.add_parser('export', help='stream rows to one file'); e.add_argument('--out', required=True); e.add_argument('--room')
+    e.add_argument('--since', type=dt.datetime.fromisoformat); e.add_argument('--until', type=dt.datetime.fromisoformat)
+    for p in (a, e): p.add_argument('--format', choices=list(WRITERS), default='jsonl'); p.add_argument('--batch', type=int, default=5000)
+    args=ap.parse_args()
+    if args.cmd=='archive':
+        print(archive(dt.datetime.now(dt.timezone.utc).replace(tzinfo=None)-dt.timedelta(days=args.retain_days), args.out, args.format, args.batch, args.compact))
+    else:
+        print({'exported':export(args.out, args.format, args.batch, since=args.since, until=args.until, room=args.room), 'path':args.out})
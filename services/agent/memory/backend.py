@@ -1,19 +1,36 @@
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, inspect, text
 from sqlalchemy.orm import Session
-import os
+import asyncio, datetime as dt, os, time
+from metrics import metrics
+from .cache import MetaCache
+from .changes import record_change
 DB_URL=os.getenv('DB_URL','sqlite:///./memory.db')
-engine=create_engine(DB_URL, future=True)
-SCHEMA_SQL = '''
+POOL_OPTS={} if DB_URL.startswith('sqlite') else {
+    'pool_size':int(os.getenv('DB_POOL_SIZE','5')), 'max_overflow':int(os.getenv('DB_MAX_OVERFLOW','10')),
+    'pool_timeout':float(os.getenv('DB_POOL_TIMEOUT','10')), 'pool_recycle':int(os.getenv('DB_POOL_RECYCLE','1800')), 'pool_pre_ping':True}
+engine=create_engine(DB_URL, future=True, **POOL_OPTS)
+SQLITE=engine.dialect.name=='sqlite'
+# Postgres only: range-partition chat_log by ts into windows of this many days (0 = one plain table)
+PARTITION_DAYS=0 if SQLITE else int(os.getenv('CHAT_LOG_PARTITION_DAYS','0'))
+# (room, seq) is the history key; on partitioned tables the key must also carry the partition column.
+CHAT_LOG_SQL = '''
+CREATE TABLE IF NOT EXISTS chat_rooms (
+  room TEXT PRIMARY KEY,
+  last_seq BIGINT NOT NULL
+);
 CREATE TABLE IF NOT EXISTS chat_log (
-  id SERIAL PRIMARY KEY,
   room TEXT NOT NULL,
+  seq BIGINT NOT NULL,
   role TEXT NOT NULL,
   content TEXT NOT NULL,
-  ts TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-);
-CREATE INDEX IF NOT EXISTS chat_log_room_ts ON chat_log(room, ts);
+  ts TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (room, seq%(key)s)
+)%(partition)s;
+CREATE INDEX IF NOT EXISTS chat_log_ts ON chat_log(ts);
+''' % {'key': ', ts' if PARTITION_DAYS else '', 'partition': ' PARTITION BY RANGE (ts)' if PARTITION_DAYS else ''}
+SCHEMA_SQL = '''
 CREATE TABLE IF NOT EXISTS voices (
-  id SERIAL PRIMARY KEY,
+  id %(id)s,
   user_id TEXT NOT NULL,
   provider TEXT NOT NULL,
   voice_id TEXT NOT NULL,
@@ -21,28 +38,76 @@ CREATE TABLE IF NOT EXISTS voices (
   UNIQUE(user_id, provider)
 );
 CREATE TABLE IF NOT EXISTS persona_index (
-  id SERIAL PRIMARY KEY,
+  id %(id)s,
   user_id TEXT NOT NULL,
   backend TEXT NOT NULL DEFAULT 'faiss',
   path TEXT NOT NULL,
   ts TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
-'''
-with engine.begin() as conn:
-    for stmt in SCHEMA_SQL.split(';'):
+CREATE TABLE IF NOT EXISTS meta_changes (
+  id %(id)s,
+  kind TEXT NOT NULL,
+  user_id TEXT NOT NULL,
+  ts TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+''' % {'id': 'INTEGER PRIMARY KEY AUTOINCREMENT' if SQLITE else 'BIGSERIAL PRIMARY KEY'}
+def run_script(conn, sql):
+    for stmt in sql.split(';'):
         s = stmt.strip()
         if s: conn.execute(text(s))
+def partition_bounds(day: dt.date) -> tuple[dt.date, dt.date]:
+    start=dt.date.fromordinal(day.toordinal()-day.toordinal()%PARTITION_DAYS); return start, start+dt.timedelta(days=PARTITION_DAYS)
+def ensure_partitions(conn, ahead=2):
+    """Create the current and next `ahead` ts windows; rows outside every window land in chat_log_default."""
+    if not PARTITION_DAYS: return
+    conn.execute(text('CREATE TABLE IF NOT EXISTS chat_log_default PARTITION OF chat_log DEFAULT'))
+    start, _ = partition_bounds(dt.datetime.now(dt.timezone.utc).date())
+    for i in range(ahead+1):
+        lo=start+dt.timedelta(days=i*PARTITION_DAYS); hi=lo+dt.timedelta(days=PARTITION_DAYS)
+        conn.execute(text(f"CREATE TABLE IF NOT EXISTS chat_log_p{lo:%Y%m%d} PARTITION OF chat_log FOR VALUES FROM ('{lo}') TO ('{hi}')"))
+def migrate_chat_log(conn):
+    """Rebuild a pre-seq chat_log (id SERIAL, ordered by ts) into the (room, seq) layout, numbering turns by (ts, id)."""
+    conn.execute(text('ALTER TABLE chat_log RENAME TO chat_log_v1')); run_script(conn, CHAT_LOG_SQL); ensure_partitions(conn)
+    conn.execute(text('''INSERT INTO chat_log(room,seq,role,content,ts)
+SELECT room, ROW_NUMBER() OVER (PARTITION BY room ORDER BY ts, id), role, content, COALESCE(ts, CURRENT_TIMESTAMP) FROM chat_log_v1'''))
+    conn.execute(text('INSERT INTO chat_rooms(room,last_seq) SELECT room, MAX(seq) FROM chat_log GROUP BY room'))
+    conn.execute(text('DROP TABLE chat_log_v1'))
+# Tables SQLite created with `id SERIAL`, which it never fills (ids stay NULL); rebuilt with real ids in rowid order.
+SERIAL_TABLES={'voices':'user_id,provider,voice_id,status', 'persona_index':'user_id,backend,path,ts'}
+def serial_id(conn, table) -> bool:
+    return any(r[1]=='id' and r[2].upper()=='SERIAL' for r in conn.execute(text(f'PRAGMA table_info({table})')))
+with engine.begin() as conn:
+    cols={c['name'] for c in inspect(conn).get_columns('chat_log')} if inspect(conn).has_table('chat_log') else None
+    if cols is not None and 'seq' not in cols: migrate_chat_log(conn)
+    run_script(conn, CHAT_LOG_SQL); ensure_partitions(conn)
+    stale=[t for t in SERIAL_TABLES if SQLITE and serial_id(conn, t)]
+    for t in stale: conn.execute(text(f'ALTER TABLE {t} RENAME TO {t}_v1'))
+    run_script(conn, SCHEMA_SQL)
+    for t in stale:
+        conn.execute(text(f'INSERT INTO {t}({SERIAL_TABLES[t]}) SELECT {SERIAL_TABLES[t]} FROM {t}_v1 ORDER BY rowid')); conn.execute(text(f'DROP TABLE {t}_v1'))
+def next_seqs(s, room, n):
+    """Reserve n consecutive turn numbers for the room; the chat_rooms row lock orders concurrent writers."""
+    last=s.execute(text('''INSERT INTO chat_rooms(room,last_seq) VALUES(:r,:n)
+ON CONFLICT(room) DO UPDATE SET last_seq=chat_rooms.last_seq+:n RETURNING last_seq'''), {'r':room,'n':n}).scalar()
+    return range(last-n+1, last+1)
 def append_message(room, role, content):
+    append_messages([(room, role, content)])
+def append_messages(rows):
+    by_room={}
+    for r,o,c in rows: by_room.setdefault(r, []).append((o, c))
     with Session(engine) as s:
-        s.execute(text('INSERT INTO chat_log(room,role,content) VALUES (:r,:o,:c)'), {'r':room,'o':role,'c':content}); s.commit()
+        params=[{'r':r,'q':q,'o':o,'c':c} for r,turns in by_room.items() for q,(o,c) in zip(next_seqs(s, r, len(turns)), turns)]
+        s.execute(text('INSERT INTO chat_log(room,seq,role,content) VALUES (:r,:q,:o,:c)'), params); s.commit()
 def load_history(room, limit=12):
+    """Last `limit` turns, read backwards along the (room, seq) primary key; no sort, whatever the table size."""
     with Session(engine) as s:
-        rows=s.execute(text('SELECT role,content FROM chat_log WHERE room=:r ORDER BY ts DESC LIMIT :n'),{'r':room,'n':limit}).all()
+        rows=s.execute(text('SELECT role,content FROM chat_log WHERE room=:r ORDER BY seq DESC LIMIT :n'),{'r':room,'n':limit}).all()
         return list(reversed([(r[0],r[1]) for r in rows]))
 def set_voice(user_id, provider, voice_id, status='ready'):
     with Session(engine) as s:
         s.execute(text("""INSERT INTO voices(user_id,provider,voice_id,status) VALUES(:u,:p,:v,:s)
-ON CONFLICT(user_id,provider) DO UPDATE SET voice_id=:v, status=:s"""), {'u':user_id,'p':provider,'v':voice_id,'s':status}); s.commit()
+ON CONFLICT(user_id,provider) DO UPDATE SET voice_id=:v, status=:s"""), {'u':user_id,'p':provider,'v':voice_id,'s':status})
+        record_change(s, 'voice', user_id); s.commit()
 def get_voice(user_id, provider):
     with Session(engine) as s:
         row=s.execute(text('SELECT voice_id,status FROM voices WHERE user_id=:u AND provider=:p'),{'u':user_id,'p':provider}).first()
@@ -50,4 +115,60 @@ def get_voice(user_id, provider):
         return None, None
 def set_persona_index(user_id, path, backend='faiss'):
     with Session(engine) as s:
-        s.execute(text('INSERT INTO persona_index(user_id,backend,path) VALUES(:u,:b,:p)'),{'u':user_id,'b':backend,'p':path}); s.commit()
+        s.execute(text('INSERT INTO persona_index(user_id,backend,path) VALUES(:u,:b,:p)'),{'u':user_id,'b':backend,'p':path})
+        record_change(s, 'index', user_id); s.commit()
+def get_persona_index(user_id):
+    with Session(engine) as s:
+        row=s.execute(text('SELECT path FROM persona_index WHERE user_id=:u ORDER BY ts DESC, id DESC LIMIT 1'),{'u':user_id}).first()
+        return row[0] if row else None
+def persona_index_dir(user_id):
+    """The user's latest recorded index, else data/indexes/{user_id} if it was built outside the trainer, else None."""
+    for path in (get_persona_index(user_id), f'data/indexes/{user_id}'):
+        if path and os.path.exists(path): return path
+    return None
+
+class MemoryWriter:
+    def __init__(self, max_queue=1000, max_batch=64, retries=3):
+        self.max_queue=max_queue; self.max_batch=max_batch; self.retries=retries
+        self.queue=None; self.task=None
+        self.stats={'written':0,'batches':0,'failed':0,'last_flush_ms':0.0,'max_flush_ms':0.0}
+    async def append(self, room, role, content):
+        if self.task is None or self.task.done():
+            self.queue=self.queue or asyncio.Queue(maxsize=self.max_queue); self.task=asyncio.create_task(self._run())
+        await self.queue.put((room, role, content))
+    async def _run(self):
+        while True:
+            batch=[await self.queue.get()]
+            while len(batch)<self.max_batch and not self.queue.empty(): batch.append(self.queue.get_nowait())
+            await self._flush(batch)
+            for _ in batch: self.queue.task_done()
+    async def _flush(self, batch):
+        for attempt in range(self.retries):
+            t0=time.perf_counter()
+            try:
+                await asyncio.to_thread(append_messages, batch)
+            except Exception as e:
+                print(f'chat_log flush failed ({attempt+1}/{self.retries}): {e}'); await asyncio.sleep(0.5*2**attempt); continue
+            ms=(time.perf_counter()-t0)*1000; metrics.observe('memory_flush', ms)
+            self.stats.update(written=self.stats['written']+len(batch), batches=self.stats['batches']+1,
+                              last_flush_ms=ms, max_flush_ms=max(ms, self.stats['max_flush_ms']))
+            return
+        self.stats['failed']+=len(batch)
+    def snapshot(self) -> dict:
+        return {**self.stats, 'queue_depth': self.queue.qsize() if self.queue else 0}
+    async def close(self, timeout=10.0):
+        if self.task is None: return
+        try: await asyncio.wait_for(self.queue.join(), timeout)
+        except asyncio.TimeoutError: print(f'chat_log flush timed out with {self.queue.qsize()} rows pending')
+        self.task.cancel()
+
+writer=MemoryWriter(max_queue=int(os.getenv('MEMORY_QUEUE_MAX','1000')), max_batch=int(os.getenv('MEMORY_BATCH_MAX','64')))
+async def aappend_message(room, role, content):
+    await writer.append(room, role, content)
+async def aload_history(room, limit=12):
+    return await asyncio.to_thread(load_history, room, limit)
+meta=MetaCache(engine, ttl_s=float(os.getenv('META_CACHE_TTL_S','300')), poll_s=float(os.getenv('META_CACHE_POLL_S','2')))
+async def aget_voice(user_id, provider):
+    return await meta.aget('voice', user_id, provider, lambda: get_voice(user_id, provider))
+async def aget_index_dir(user_id):
+    return await meta.aget('index', user_id, None, lambda: persona_index_dir(user_id))
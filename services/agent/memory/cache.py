@@ -0,0 +1,83 @@
+import asyncio, select, threading, time
+from sqlalchemy import text
+from .changes import CHANNEL
+_MISS=object()
+
+class MetaCache:
+    """TTL-bounded read-through cache of per-user metadata (voice assignments, persona index paths).
+
+    Writers record every change in the meta_changes table (and NOTIFY on Postgres); a
+    background thread LISTENs for those, or polls the table on other databases, and drops
+    the user's entries. The TTL bounds staleness if a notification is missed.
+    """
+    def __init__(self, engine, ttl_s=300.0, poll_s=2.0, max_users=10000):
+        self.engine=engine; self.ttl_s=ttl_s; self.poll_s=poll_s; self.max_users=max_users
+        self.entries: dict[tuple, dict] = {}; self.gens: dict[tuple, int] = {}; self.lock=threading.Lock(); self.thread=None
+        self.stats={'hits':0,'misses':0,'expired':0,'invalidations':0,'resets':0,'listen_errors':0}
+    def peek(self, kind: str, user_id: str, extra=None):
+        with self.lock:
+            hit=self.entries.get((kind, user_id), {}).get(extra)
+            if hit is None: return _MISS
+            if hit[0]<time.monotonic(): self.stats['expired']+=1; return _MISS
+            self.stats['hits']+=1; return hit[1]
+    def get(self, kind: str, user_id: str, extra, loader):
+        value=self.peek(kind, user_id, extra)
+        if value is not _MISS: return value
+        self.start()
+        with self.lock: self.stats['misses']+=1; gen=self.gens.get((kind, user_id), 0)
+        value=loader()
+        with self.lock:
+            if self.gens.get((kind, user_id), 0)==gen:
+                if len(self.entries)>=self.max_users and (kind, user_id) not in self.entries: self.entries.pop(next(iter(self.entries)))
+                self.entries.setdefault((kind, user_id), {})[extra]=(time.monotonic()+self.ttl_s, value)
+        return value
+    async def aget(self, kind: str, user_id: str, extra, loader):
+        value=self.peek(kind, user_id, extra)
+        return value if value is not _MISS else await asyncio.to_thread(self.get, kind, user_id, extra, loader)
+    def invalidate(self, kind: str, user_id: str):
+        with self.lock:
+            self.entries.pop((kind, user_id), None); self.gens[(kind, user_id)]=self.gens.get((kind, user_id), 0)+1
+            self.stats['invalidations']+=1
+    def reset(self):
+        with self.lock:
+            for key in self.entries: self.gens[key]=self.gens.get(key, 0)+1
+            self.entries.clear(); self.stats['resets']+=1
+    def _apply(self, payload: str):
+        kind, _, user_id = payload.partition(':'); self.invalidate(kind, user_id)
+    def start(self):
+        if self.thread is None:
+            with self.lock:
+                if self.thread is None:
+                    self.thread=threading.Thread(target=self._run, name='meta-cache', daemon=True); self.thread.start()
+    def _run(self):
+        while True:
+            try:
+                self._listen() if self.engine.dialect.name=='postgresql' else self._poll()
+            except Exception as e:
+                self.stats['listen_errors']+=1; print(f'Metadata change feed failed, retrying: {e!r}')
+            self.reset(); time.sleep(self.poll_s)
+    def _listen(self):
+        raw=self.engine.raw_connection(); raw.detach(); conn=raw.driver_connection
+        try:
+            conn.autocommit=True
+            with conn.cursor() as cur: cur.execute(f'LISTEN {CHANNEL}')
+            self.reset()
+            while True:
+                if select.select([conn], [], [], self.poll_s)[0]:
+                    conn.poll()
+                    while conn.notifies: self._apply(conn.notifies.pop(0).payload)
+        finally:
+            raw.close()
+    def _poll(self):
+        with self.engine.connect() as conn:
+            last=conn.execute(text('SELECT COALESCE(MAX(id), 0) FROM meta_changes')).scalar()
+        self.reset()
+        while True:
+            time.sleep(self.poll_s)
+            with self.engine.connect() as conn:
+                rows=conn.execute(text('SELECT id, kind, user_id FROM meta_changes WHERE id>:last ORDER BY id'), {'last':last}).all()
+            for id_, kind, user_id in rows: self.invalidate(kind, user_id); last=id_
+    def snapshot(self) -> dict:
+        with self.lock:
+            lookups=self.stats['hits']+self.stats['misses']
+            return {**self.stats, 'users':len(self.entries), 'hit_rate': self.stats['hits']/lookups if lookups else 0.0}
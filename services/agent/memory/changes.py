@@ -0,0 +1,11 @@
+from sqlalchemy import text
+CHANNEL='meta_changes'
+
+def record_change(s, kind: str, user_id: str, keep=1000):
+    """Log a metadata change in the writer's transaction so MetaCache instances drop the user's entries.
+
+    Shared by every writer of voices/persona_index (the agent backend and the trainer API).
+    """
+    s.execute(text('INSERT INTO meta_changes(kind,user_id) VALUES(:k,:u)'), {'k':kind,'u':user_id})
+    s.execute(text('DELETE FROM meta_changes WHERE id < (SELECT MAX(id) FROM meta_changes) - :n'), {'n':keep})
+    if s.get_bind().dialect.name=='postgresql': s.execute(text('SELECT pg_notify(:c, :p)'), {'c':CHANNEL,'p':f'{kind}:{user_id}'})
@@ -0,0 +1,94 @@
+import json, os, random, threading, time
+from bisect import bisect_left
+from contextlib import contextmanager
+from pathlib import Path
+BUCKETS_MS=(5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+def _order(item):
+    (stage, session), _ = item; return stage, session or ''
+
+class Histogram:
+    __slots__=('counts','sum','count')
+    def __init__(self, counts=None, total=0.0, count=0):
+        self.counts=list(counts) if counts else [0]*(len(BUCKETS_MS)+1); self.sum=total; self.count=count
+    def observe(self, ms: float):
+        self.counts[bisect_left(BUCKETS_MS, ms)]+=1; self.sum+=ms; self.count+=1
+    def merge(self, other: 'Histogram'):
+        self.counts=[a+b for a,b in zip(self.counts, other.counts)]; self.sum+=other.sum; self.count+=other.count
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-quantile (inf past the last bucket)."""
+        need=q*self.count; seen=0
+        for bound, n in zip(BUCKETS_MS+(float('inf'),), self.counts):
+            seen+=n
+            if seen>=need and n: return bound
+        return 0.0
+    def state(self):
+        return (self.counts, self.sum, self.count)
+
+class Metrics:
+    """Per-process stage latency histograms (overall and per session) and counters, rendered in Prometheus text format.
+
+    Stages are recorded once per turn or per provider call, never per audio frame.
+    """
+    def __init__(self, prefix='agent', sample_rate=0.0, trace_path=None):
+        self.prefix=prefix; self.sample_rate=sample_rate; self.trace_path=Path(trace_path) if trace_path else None
+        self.lock=threading.Lock(); self.hists: dict[tuple, Histogram] = {}; self.counters: dict[str, float] = {}
+    def observe(self, stage: str, ms: float, session=None):
+        with self.lock:
+            for key in ((stage, None), (stage, session)) if session else ((stage, None),):
+                h=self.hists.get(key)
+                if h is None: h=self.hists[key]=Histogram()
+                h.observe(ms)
+    def inc(self, name: str, n=1):
+        with self.lock: self.counters[name]=self.counters.get(name, 0)+n
+    @contextmanager
+    def span(self, stage: str, session=None):
+        t0=time.perf_counter()
+        try: yield
+        finally: self.observe(stage, (time.perf_counter()-t0)*1000, session)
+    def drop_session(self, session: str):
+        with self.lock:
+            for key in [k for k in self.hists if k[1]==session]: del self.hists[key]
+    def trace(self, session: str) -> 'TurnTrace':
+        return TurnTrace(self, session, self.trace_path is not None and random.random()<self.sample_rate)
+    def export(self) -> dict:
+        with self.lock:
+            return {'hists':[(k, h.state()) for k,h in self.hists.items()], 'counters':dict(self.counters)}
+    def merge(self, exported: dict):
+        with self.lock:
+            for key, state in exported['hists']:
+                key=tuple(key); h=self.hists.get(key)
+                if h is None: self.hists[key]=Histogram(*state)
+                else: h.merge(Histogram(*state))
+            for name, n in exported['counters'].items(): self.counters[name]=self.counters.get(name, 0)+n
+    def summary(self, session=None) -> dict:
+        with self.lock:
+            return {stage: {'n':h.count, 'avg_ms':round(h.sum/h.count, 1), 'p95_ms':h.quantile(0.95)}
+                    for (stage, s), h in sorted(self.hists.items(), key=_order) if s==session and h.count}
+    def render(self) -> str:
+        name=f'{self.prefix}_stage_latency_ms'; lines=[f'# TYPE {name} histogram']
+        with self.lock:
+            for (stage, session), h in sorted(self.hists.items(), key=_order):
+                labels=f'stage="{stage}"'+(f',session="{session}"' if session else ''); seen=0
+                for bound, n in zip(BUCKETS_MS+('+Inf',), h.counts):
+                    seen+=n; lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {seen}')
+                lines+= [f'{name}_sum{{{labels}}} {h.sum:.3f}', f'{name}_count{{{labels}}} {h.count}']
+            for counter, n in sorted(self.counters.items()):
+                lines+= [f'# TYPE {self.prefix}_{counter}_total counter', f'{self.prefix}_{counter}_total {n}']
+        return '\n'.join(lines)+'\n'
+
+class TurnTrace:
+    """Milestones of one conversational turn, in ms since the user stopped speaking."""
+    def __init__(self, metrics: Metrics, session: str, sampled: bool):
+        self.metrics=metrics; self.session=session; self.sampled=sampled; self.t0=time.perf_counter(); self.wall=time.time(); self.marks={}
+    def mark(self, name: str):
+        if name not in self.marks: self.marks[name]=(time.perf_counter()-self.t0)*1000
+    def finish(self, **info):
+        self.mark('done')
+        for name, ms in self.marks.items(): self.metrics.observe(f'turn_{name}', ms, self.session)
+        if self.sampled:
+            self.metrics.trace_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.metrics.trace_path, 'a') as f:
+                f.write(json.dumps({'session':self.session,'ts':self.wall,'marks_ms':{k:round(v, 1) for k,v in self.marks.items()}, **info})+'\n')
+
+metrics=Metrics('agent', sample_rate=float(os.getenv('TRACE_SAMPLE_RATE','0')), trace_path=os.getenv('TRACE_PATH','data/traces/turns.jsonl'))
@@ -0,0 +1,63 @@
+import math, faiss
+import numpy as np
+FLAT_MAX=50_000; HNSW_MAX=2_000_000
+KINDS=('flat','flat_fp16','flat_sq8','hnsw','ivfpq')
+STORAGE={'fp32':'flat','fp16':'flat_fp16','int8':'flat_sq8'}
+
+def choose_kind(n: int, recall_target=0.95, storage='fp32') -> str:
+    if n<=FLAT_MAX or recall_target>=0.995: return STORAGE[storage]
+    if recall_target>=0.9 and n<=HNSW_MAX: return 'hnsw'
+    return 'ivfpq'
+
+def ivf_nlist(n: int) -> int:
+    return int(min(65536, max(16, 4*math.sqrt(n))))
+
+def pq_m(d: int) -> int:
+    return next(m for m in range(max(1, d//4), 0, -1) if d%m==0)
+
+def make_index(kind: str, d: int, n: int):
+    if kind=='flat': inner=faiss.IndexFlatIP(d)
+    elif kind=='flat_fp16': inner=faiss.IndexScalarQuantizer(d, faiss.ScalarQuantizer.QT_fp16, faiss.METRIC_INNER_PRODUCT)
+    elif kind=='flat_sq8': inner=faiss.IndexScalarQuantizer(d, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT)
+    elif kind=='hnsw':
+        inner=faiss.IndexHNSWFlat(d, 32, faiss.METRIC_INNER_PRODUCT); inner.hnsw.efConstruction=200
+    elif kind=='ivfpq':
+        inner=faiss.IndexIVFPQ(faiss.IndexFlatIP(d), d, ivf_nlist(n), pq_m(d), 8, faiss.METRIC_INNER_PRODUCT)
+    else: raise ValueError(f'index kind must be one of {KINDS}')
+    return faiss.IndexIDMap2(inner)
+
+def inner_index(index):
+    return faiss.downcast_index(index.index) if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)) else index
+
+def kind_of(index) -> str:
+    inner=inner_index(index)
+    if isinstance(inner, faiss.IndexHNSW): return 'hnsw'
+    if isinstance(inner, faiss.IndexIVF): return 'ivfpq'
+    if isinstance(inner, faiss.IndexScalarQuantizer): return 'flat_fp16' if inner.sq.qtype==faiss.ScalarQuantizer.QT_fp16 else 'flat_sq8'
+    return 'flat'
+
+def supports_remove(kind: str) -> bool:
+    return kind!='hnsw'
+
+def build_index(kind: str, vectors, ids, batch=65536, seed=1234, labels=None):
+    """Index rows `ids` of `vectors`, stored under those ids or, if given, under the matching `labels`."""
+    ids=np.asarray(ids, dtype='int64'); labels=ids if labels is None else np.asarray(labels, dtype='int64'); index=make_index(kind, vectors.shape[1], len(ids))
+    if not index.is_trained:
+        rng=np.random.default_rng(seed); nsample=min(len(ids), 64*ivf_nlist(len(ids)) if kind=='ivfpq' else 65536)
+        sample=np.sort(rng.choice(ids, nsample, replace=False)) if nsample<len(ids) else ids
+        index.train(np.ascontiguousarray(vectors[sample], dtype='float32'))
+    for i in range(0, len(ids), batch):
+        part=ids[i:i+batch]; index.add_with_ids(np.ascontiguousarray(vectors[part], dtype='float32'), labels[i:i+batch])
+    return index
+
+def search_params(index, nprobe=None, ef_search=None, sel=None):
+    inner=inner_index(index); extra={'sel':sel} if sel is not None else {}
+    if isinstance(inner, faiss.IndexIVF) and (nprobe or extra): return faiss.SearchParametersIVF(nprobe=nprobe or inner.nprobe, **extra)
+    if isinstance(inner, faiss.IndexHNSW) and (ef_search or extra): return faiss.SearchParametersHNSW(efSearch=ef_search or inner.hnsw.efSearch, **extra)
+    return faiss.SearchParameters(**extra) if extra else None
+
+def rerank(vectors, q, ids, k: int):
+    ids=ids[ids>=0]
+    if not len(ids): return np.zeros(0, dtype='float32'), ids
+    scores=np.asarray(vectors[np.sort(ids)], dtype='float32')@q.ravel(); order=np.argsort(-scores)[:k]
+    return scores[order], np.sort(ids)[order]
@@ -0,0 +1,74 @@
+import os
+import numpy as np
+from pathlib import Path
+MAX_SEQ_LEN=256
+TOLERANCE={'fp32':0.9999, 'int8':0.99}
+
+class TorchEncoder:
+    def __init__(self, name: str, threads=None):
+        if threads:
+            import torch; torch.set_num_threads(threads)
+        from sentence_transformers import SentenceTransformer
+        self.model=SentenceTransformer(name)
+    def get_sentence_embedding_dimension(self):
+        return self.model.get_sentence_embedding_dimension()
+    def encode(self, texts, batch_size=32, **kw):
+        return self.model.encode(texts, batch_size=batch_size, convert_to_numpy=True, show_progress_bar=kw.get('show_progress_bar', False))
+
+class OnnxEncoder:
+    def __init__(self, model_dir, quantized=True, threads=1):
+        try:
+            import onnxruntime as ort
+            from tokenizers import Tokenizer
+        except ImportError as e:
+            raise RuntimeError('RAG_ENCODER=onnx needs onnxruntime and tokenizers installed') from e
+        model_dir=Path(model_dir); path=model_dir/('model_int8.onnx' if quantized else 'model.onnx')
+        opts=ort.SessionOptions(); opts.intra_op_num_threads=threads; opts.inter_op_num_threads=1
+        opts.graph_optimization_level=ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session=ort.InferenceSession(str(path), opts, providers=['CPUExecutionProvider'])
+        self.inputs={i.name for i in self.session.get_inputs()}; self.dim=self.session.get_outputs()[0].shape[-1]
+        self.tokenizer=Tokenizer.from_file(str(model_dir/'tokenizer.json'))
+        self.tokenizer.enable_truncation(max_length=MAX_SEQ_LEN); self.tokenizer.enable_padding()
+    def get_sentence_embedding_dimension(self):
+        return self.dim
+    def encode(self, texts, batch_size=32, **kw):
+        out=[]
+        for i in range(0, len(texts), batch_size):
+            enc=self.tokenizer.encode_batch(list(texts[i:i+batch_size]))
+            ids=np.array([e.ids for e in enc], dtype='int64'); mask=np.array([e.attention_mask for e in enc], dtype='int64')
+            feed={'input_ids':ids, 'attention_mask':mask, 'token_type_ids':np.zeros_like(ids)}
+            hidden=self.session.run(None, {k:v for k,v in feed.items() if k in self.inputs})[0]
+            m=mask[..., None].astype('float32'); pooled=(hidden*m).sum(1)/np.clip(m.sum(1), 1e-9, None)
+            out.append(pooled/np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None))
+        return np.vstack(out).astype('float32') if out else np.zeros((0, self.dim), dtype='float32')
+
+def load_encoder(name: str):
+    backend=os.getenv('RAG_ENCODER','torch'); threads=int(os.getenv('RAG_ENCODER_THREADS','0')) or None
+    if backend=='onnx':
+        return OnnxEncoder(os.getenv('RAG_ONNX_DIR', f'data/models/{name.split("/")[-1]}-onnx'), os.getenv('RAG_ONNX_QUANTIZED','1')=='1', threads or 1)
+    if backend!='torch': raise ValueError('RAG_ENCODER must be torch or onnx')
+    return TorchEncoder(name, threads)
+
+def export_onnx(name: str, out_dir: str, samples=None):
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    outp=Path(out_dir); outp.mkdir(parents=True, exist_ok=True)
+    tok=AutoTokenizer.from_pretrained(name); model=AutoModel.from_pretrained(name).eval(); tok.save_pretrained(outp)
+    dummy=tok(['export'], return_tensors='pt')
+    torch.onnx.export(model, (dummy['input_ids'], dummy['attention_mask'], dummy['token_type_ids']), str(outp/'model.onnx'),
+                      input_names=['input_ids','attention_mask','token_type_ids'], output_names=['last_hidden_state'],
+                      dynamic_axes={k:{0:'batch',1:'seq'} for k in ('input_ids','attention_mask','token_type_ids','last_hidden_state')}, opset_version=14)
+    quantize_dynamic(str(outp/'model.onnx'), str(outp/'model_int8.onnx'), weight_type=QuantType.QInt8)
+    samples=samples or ['Hello, how are you today?', 'Tell me about your favourite book.', 'The weather in Seoul is warm in summer.']
+    ref=TorchEncoder(name).encode(samples); report={}
+    for precision, quantized in (('fp32', False), ('int8', True)):
+        cos=float((OnnxEncoder(outp, quantized).encode(samples)*ref).sum(1).min()); report[precision]=cos
+        if cos<TOLERANCE[precision]: raise RuntimeError(f'{precision} ONNX export drifted: min cosine {cos:.5f} < {TOLERANCE[precision]}')
+    return report
+
+if __name__=='__main__':
+    import argparse
+    ap=argparse.ArgumentParser(description='Export the RAG encoder to ONNX (fp32 + dynamic int8) and check it against the torch model.')
+    ap.add_argument('--model', default='sentence-transformers/all-MiniLM-L6-v2'); ap.add_argument('--out', default='data/models/all-MiniLM-L6-v2-onnx')
+    args=ap.parse_args(); print(f'Exported {args.model} → {args.out}; min cosine vs torch: {export_onnx(args.model, args.out)}')
@@ -1,24 +1,217 @@
-from sentence_transformers import SentenceTransformer
-import faiss, json
+import faiss, gc, hashlib, json, os, shutil, time
+import numpy as np
 from pathlib import Path
-from .loaders import load_texts
+from .loaders import list_files, DocumentLoader
+from .registry import get_encoder, index_version
+from . import ann, store
 MODEL='sentence-transformers/all-MiniLM-L6-v2'
+CHUNK_SIZE=700; CHUNK_OVERLAP=120
 
-def chunk(text, size=700, overlap=120):
+def chunk(text, size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
     out=[]; i=0
     while i<len(text): out.append(text[i:i+size]); i+= size-overlap
     return out
 
-def build_faiss(corpus_dir: str, out_dir: str):
-    outp=Path(out_dir); outp.mkdir(parents=True, exist_ok=True)
-    model=SentenceTransformer(MODEL)
-    texts=[]
-    for t in load_texts(Path(corpus_dir)): texts.extend(chunk(t))
-    embs=model.encode(texts, convert_to_numpy=True, show_progress_bar=True)
-    index=faiss.IndexFlatIP(embs.shape[1]); faiss.normalize_L2(embs); index.add(embs.astype('float32'))
-    faiss.write_index(index, str(outp/'faiss.index'))
-    (outp/'meta.json').write_text(json.dumps({'texts':texts}, ensure_ascii=False))
-    print(f'Indexed {len(texts)} chunks → {outp}')
+def chunk_stream(pieces, size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
+    buf=''
+    for piece in pieces:
+        buf+=piece
+        while len(buf)>=size: yield buf[:size]; buf=buf[size-overlap:]
+    while buf: yield buf[:size]; buf=buf[size-overlap:]
+
+def rss_mb() -> float:
+    try:
+        with open('/proc/self/statm') as f: return int(f.read().split()[1])*os.sysconf('SC_PAGE_SIZE')/2**20
+    except OSError: return 0.0
+
+class Progress:
+    def __init__(self, every_s=5.0):
+        self.every_s=every_s; self.t0=self.last=time.perf_counter(); self.n=0; self.peak_mb=0.0
+    def tick(self, n):
+        self.n+=n; now=time.perf_counter(); self.peak_mb=max(self.peak_mb, rss_mb())
+        if now-self.last>=self.every_s:
+            self.last=now; print(f'  {self.n} chunks, {self.rate():.1f} chunks/s, rss {rss_mb():.0f} MB', flush=True)
+    def rate(self):
+        return self.n/max(time.perf_counter()-self.t0, 1e-9)
+
+def file_hash(p: Path) -> str:
+    h=hashlib.sha256()
+    with open(p, 'rb') as f:
+        for block in iter(lambda: f.read(1<<20), b''): h.update(block)
+    return h.hexdigest()
+
+def _write_atomic(path: Path, data: str):
+    tmp=path.with_suffix(path.suffix+'.tmp'); tmp.write_text(data, encoding='utf-8'); os.replace(tmp, path)
+
+def load_manifest(outp: Path):
+    try: m=json.loads((outp/'manifest.json').read_text())
+    except (OSError, ValueError): return None
+    if m.get('model')!=MODEL or m.get('chunk')!=[CHUNK_SIZE, CHUNK_OVERLAP]: return None
+    if not (outp/'faiss.index').exists() or not store.exists(outp): return None
+    return m
+
+def _remap_files(files, remap):
+    for f in files.values():
+        kept=[remap[i] for i in range(f['start'], f['end']) if i in remap]; f['start'], f['end'] = (kept[0], kept[-1]+1) if kept else (0, 0)
+
+def _migrate_vectors(outp: Path, index, n: int, dim: int):
+    vecs=store.VectorWriter(outp, dim, fresh=True)
+    for i in range(n):
+        try: v=index.reconstruct(i)
+        except RuntimeError: v=np.zeros(dim, dtype='float32')
+        vecs.append(v[None, :])
+    vecs.commit()
+
+def build_faiss(corpus_dir: str, out_dir: str, full=False, batch_size=256, max_memory_mb=1024, workers=None, cache_dir=None, kind='auto', recall_target=0.95, storage='fp32'):
+    corpus=Path(corpus_dir); outp=Path(out_dir); outp.mkdir(parents=True, exist_ok=True)
+    model=get_encoder(MODEL); dim=model.get_sentence_embedding_dimension()
+    manifest=None if full else load_manifest(outp)
+    if manifest:
+        if not (outp/store.OFFSETS).exists(): store.convert_meta(outp)
+        index=faiss.read_index(str(outp/'faiss.index')); chunks=store.ChunkStoreWriter(outp); old=manifest['files']
+        if not (outp/store.VECTORS).exists(): _migrate_vectors(outp, index, len(chunks), dim)
+        vecs=store.VectorWriter(outp, dim); old_kind=manifest.get('kind') or ann.kind_of(index)
+    else:
+        index=None; chunks=store.ChunkStoreWriter(outp, fresh=True); vecs=store.VectorWriter(outp, dim, fresh=True); old={}; old_kind=None
+    current={str(p.relative_to(corpus)): (p, file_hash(p)) for p in list_files(corpus)}
+    files={}; stale=[]; changed=[]
+    for rel,(p,h) in current.items():
+        prev=old.get(rel)
+        if prev and prev['sha256']==h: files[rel]=prev; continue
+        if prev: stale.append(prev)
+        changed.append((rel, p, h))
+    stale+=[f for rel,f in old.items() if rel not in current]
+    removed=0
+    for f in stale:
+        ids=np.arange(f['start'], f['end'], dtype='int64')
+        if not len(ids): continue
+        if ann.supports_remove(old_kind): index.remove_ids(ids)
+        chunks.delete(ids.tolist()); removed+=len(ids)
+    progress=Progress(); added=0
+    def flush(batch):
+        embs=model.encode(batch, batch_size=min(64, len(batch)), convert_to_numpy=True, show_progress_bar=False).astype('float32'); faiss.normalize_L2(embs)
+        ids=np.array([chunks.add(t) for t in batch], dtype='int64'); vecs.append(embs)
+        if index is not None: index.add_with_ids(embs, ids)
+        progress.tick(len(batch))
+    loader=DocumentLoader(workers, cache_dir)
+    for (rel,p,h),(_,pieces) in zip(changed, loader.iter_documents((p,h) for _,p,h in changed)):
+        start=len(chunks); batch=[]
+        for c in chunk_stream(pieces):
+            batch.append(c)
+            if len(batch)>=batch_size:
+                flush(batch); batch=[]
+                if rss_mb()>max_memory_mb and batch_size>8: batch_size//=2; gc.collect()
+        if batch: flush(batch)
+        files[rel]={'sha256':h,'start':start,'end':len(chunks)}; added+=len(chunks)-start
+    live_n=len(chunks)-chunks.holes()
+    new_kind=ann.choose_kind(live_n, recall_target, storage) if kind=='auto' else kind
+    if chunks.holes()>len(chunks)//2:
+        remap=chunks.compact(); vecs.compact(sorted(remap)); _remap_files(files, remap); index=None
+    if index is None or new_kind!=old_kind:
+        live=chunks.live_ids(); t0=time.perf_counter()
+        index=ann.build_index(new_kind, vecs.view(), live) if live else ann.make_index('flat', dim, 0)
+        print(f'  built {new_kind} index over {len(live)} vectors in {time.perf_counter()-t0:.1f}s')
+    else: new_kind=old_kind
+    chunks.commit(); vecs.commit()
+    faiss.write_index(index, str(outp/'faiss.index.tmp')); os.replace(outp/'faiss.index.tmp', outp/'faiss.index')
+    _write_atomic(outp/'manifest.json', json.dumps({'model':MODEL,'chunk':[CHUNK_SIZE, CHUNK_OVERLAP],'kind':new_kind,'files':files}))
+    (outp/'meta.json').unlink(missing_ok=True)
+    print(f'Indexed {len(current)} files ({len(changed)} changed, {len(stale)} stale): +{added} / -{removed} chunks, {live_n} live ({new_kind}) → {outp}')
+    if added: print(f'  {progress.rate():.1f} chunks/s, peak rss {progress.peak_mb:.0f} MB, extraction {loader.stats}')
+
+def env_options() -> dict:
+    return {'batch_size':int(os.getenv('INDEX_BATCH_SIZE','256')), 'max_memory_mb':int(os.getenv('INDEX_MAX_MEMORY_MB','1024')),
+            'workers':int(os.getenv('INDEX_WORKERS','0')) or None, 'cache_dir':os.getenv('EXTRACT_CACHE_DIR','data/cache/extract'),
+            'kind':os.getenv('INDEX_KIND','auto'), 'recall_target':float(os.getenv('INDEX_RECALL_TARGET','0.95')), 'storage':os.getenv('INDEX_STORAGE','fp32')}
+
+def _swap_link(link: Path, target: Path):
+    tmp=link.with_name(f'.{link.name}.{os.getpid()}.lnk'); tmp.unlink(missing_ok=True)
+    os.symlink(os.path.relpath(target, link.parent), tmp); os.replace(tmp, link)
+
+def _next_version(link: Path) -> tuple[list, Path, Path]:
+    versions=link.with_name(link.name+'.versions'); versions.mkdir(parents=True, exist_ok=True)
+    if link.is_dir() and not link.is_symlink():
+        os.replace(link, versions/'v000000'); _swap_link(link, versions/'v000000')
+    existing=sorted(p for p in versions.iterdir() if p.name[:1]=='v' and p.name[1:].isdigit())
+    new=versions/f'v{int(existing[-1].name[1:])+1 if existing else 1:06d}'; tmp=new.with_name(new.name+'.tmp')
+    shutil.rmtree(tmp, ignore_errors=True); return existing, new, tmp
+
+def _publish(link: Path, existing: list, new: Path, tmp: Path, keep: int):
+    os.replace(tmp, new); _swap_link(link, new)
+    for old in (existing+[new])[:-max(1, keep)]: shutil.rmtree(old, ignore_errors=True)
+
+def build_version(corpus_dir: str, out_dir: str, full=False, keep=2, **opts) -> Path:
+    """Build into a fresh `<out>.versions/vNNNNNN` copy of the live index and atomically repoint the `<out>` symlink at it."""
+    link=Path(out_dir); existing, new, tmp = _next_version(link)
+    if not full and link.is_symlink() and link.resolve().is_dir(): shutil.copytree(link.resolve(), tmp)
+    try:
+        build_faiss(corpus_dir, str(tmp), full=full, **opts)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True); raise
+    _publish(link, existing, new, tmp, keep); return new
+
+def _source_vectors(src: Path, index, n: int):
+    vectors=store.open_vectors(src, index.d)
+    if len(vectors)>=n: return vectors
+    out=np.zeros((n, index.d), dtype='float32')
+    for i in range(n):
+        try: out[i]=index.reconstruct(i)
+        except RuntimeError: pass
+    return out
+
+def build_shared(index_root: str, out_dir: str, users=None, keep=2, kind='auto', recall_target=0.95, storage='fp32') -> Path:
+    """Merge per-user indexes into one versioned index shared by all tenants.
+
+    Each user's live chunks and vectors are laid out contiguously and indexed under ids
+    `tenant << TENANT_BITS | row`, so a query can scan its own rows of the memory-mapped
+    vectors or search the shared index restricted to its id range. tenants.json records
+    each user's rows and the per-user index version they were copied from.
+    """
+    root=Path(index_root); link=Path(out_dir)
+    users=sorted(users or [p.name for p in root.iterdir() if p.resolve()!=link.resolve() and p.name[:1] not in '._'
+                           and not p.name.endswith('.versions') and (p/'faiss.index').exists()])
+    existing, new, tmp = _next_version(link); t0=time.perf_counter()
+    try:
+        chunks=store.ChunkStoreWriter(tmp, fresh=True); vecs=None; tenants={}; rows=[]; labels=[]
+        for t, user in enumerate(users):
+            src=root/user; index=faiss.read_index(str(src/'faiss.index')); src_chunks=store.ChunkStore(src)
+            try:
+                live=np.flatnonzero(src_chunks.offsets[:,1]>=0) if len(src_chunks) else np.zeros(0, dtype='int64')
+                vectors=_source_vectors(src, index, len(src_chunks)); vecs=vecs or store.VectorWriter(tmp, index.d, fresh=True)
+                start=len(chunks)
+                for i in live.tolist(): chunks.add(src_chunks[i])
+                for i in range(0, len(live), 65536): vecs.append(vectors[live[i:i+65536]])
+                rows.append(np.arange(start, len(chunks))); labels.append((t<<store.TENANT_BITS)+np.arange(len(live)))
+                tenants[user]={'tenant':t,'start':start,'end':len(chunks),'source':list(index_version(src))}
+            finally:
+                src_chunks.close()
+        if vecs is None: raise ValueError(f'no per-user indexes found under {root}')
+        chunks.commit(); rows=np.concatenate(rows); labels=np.concatenate(labels)
+        new_kind=ann.choose_kind(len(rows), recall_target, storage) if kind=='auto' else kind
+        index=ann.build_index(new_kind, vecs.view(), rows, labels=labels) if len(rows) else ann.make_index('flat', vecs.dim, 0)
+        vecs.commit(); faiss.write_index(index, str(tmp/'faiss.index'))
+        _write_atomic(tmp/store.TENANTS, json.dumps(tenants))
+        _write_atomic(tmp/'manifest.json', json.dumps({'model':MODEL,'chunk':[CHUNK_SIZE, CHUNK_OVERLAP],'kind':new_kind,'shared':True}))
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True); raise
+    _publish(link, existing, new, tmp, keep)
+    print(f'Shared index: {len(tenants)} tenants, {len(rows)} chunks ({new_kind}) in {time.perf_counter()-t0:.1f}s → {new}')
+    return new
+
 if __name__=='__main__':
     import argparse
-    ap=argparse.ArgumentParser(); ap.add_argument('--corpus', default='data/persona/default'); ap.add_argument('--out', default='data/indexes/default'); args=ap.parse_args(); build_faiss(args.corpus, args.out)
+    ap=argparse.ArgumentParser(); ap.add_argument('--corpus', default='data/persona/default'); ap.add_argument('--out', default='data/indexes/default')
+    ap.add_argument('--full', action='store_true', help='ignore the manifest and rebuild from scratch')
+    env=env_options()
+    ap.add_argument('--batch-size', type=int, default=env['batch_size']); ap.add_argument('--max-memory-mb', type=int, default=env['max_memory_mb'])
+    ap.add_argument('--workers', type=int, default=env['workers']); ap.add_argument('--cache-dir', default=env['cache_dir'])
+    ap.add_argument('--kind', choices=('auto',)+ann.KINDS, default=env['kind']); ap.add_argument('--recall-target', type=float, default=env['recall_target'])
+    ap.add_argument('--storage', choices=tuple(ann.STORAGE), default=env['storage'], help='vector precision for flat indexes')
+    ap.add_argument('--versioned', action='store_true', help='build into <out>.versions/ and swap the <out> symlink when done')
+    ap.add_argument('--keep', type=int, default=int(os.getenv('INDEX_KEEP_VERSIONS','2')), help='versions to keep with --versioned or --shared')
+    ap.add_argument('--shared', action='store_true', help='merge the per-user indexes under --index-root into one tenant-tagged index at --out')
+    ap.add_argument('--index-root', default='data/indexes'); ap.add_argument('--users', nargs='*', help='with --shared: tenants to include (default: all)')
+    args=ap.parse_args(); opts=dict(batch_size=args.batch_size, max_memory_mb=args.max_memory_mb, workers=args.workers, cache_dir=args.cache_dir, kind=args.kind, recall_target=args.recall_target, storage=args.storage)
+    if args.shared: build_shared(args.index_root, args.out, users=args.users, keep=args.keep, kind=args.kind, recall_target=args.recall_target, storage=args.storage)
+    elif args.versioned: build_version(args.corpus, args.out, full=args.full, keep=args.keep, **opts)
+    else: build_faiss(args.corpus, args.out, full=args.full, **opts)
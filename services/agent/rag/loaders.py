@@ -1,11 +1,85 @@
+import multiprocessing as mp, os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from pypdf import PdfReader
+TEXT_SUFFIXES={'.txt','.md'}
+UNSTRUCTURED_SUFFIXES={'.docx','.doc','.pptx','.ppt','.xlsx','.csv','.html','.htm','.xml','.rtf','.odt','.epub','.eml','.msg','.rst','.org'}
+SUFFIXES=TEXT_SUFFIXES|{'.pdf'}|UNSTRUCTURED_SUFFIXES
+BLOCK_CHARS=1<<20
+PDF_PAGES_PER_TASK=16
+def list_files(corpus_dir: Path):
+    return sorted(p for p in corpus_dir.rglob('*') if p.is_file() and p.suffix.lower() in SUFFIXES)
+def _read_blocks(p: Path):
+    with open(p, encoding='utf-8', errors='ignore') as f:
+        for block in iter(lambda: f.read(BLOCK_CHARS), ''): yield block
+def extract_pdf_pages(path: str, start: int, end: int) -> str:
+    pages=PdfReader(path).pages
+    return '\n'.join(pages[i].extract_text() or '' for i in range(start, min(end, len(pages))))
+def extract_unstructured(path: str) -> str:
+    from unstructured.partition.auto import partition
+    return '\n\n'.join(el.text for el in partition(filename=path) if getattr(el, 'text', None))
+def iter_file_text(p: Path):
+    suffix=p.suffix.lower()
+    if suffix=='.pdf':
+        for i,page in enumerate(PdfReader(str(p)).pages):
+            yield ('\n' if i else '') + (page.extract_text() or '')
+    elif suffix in UNSTRUCTURED_SUFFIXES:
+        yield extract_unstructured(str(p))
+    else:
+        yield from _read_blocks(p)
+def load_file(p: Path) -> str:
+    return ''.join(iter_file_text(p))
 def load_texts(corpus_dir: Path):
-    texts=[]
-    for p in corpus_dir.rglob('*'):
-        if p.suffix.lower() in {'.txt','.md'}:
-            texts.append(p.read_text(encoding='utf-8', errors='ignore'))
-        elif p.suffix.lower()=='.pdf':
-            reader=PdfReader(str(p)); parts=[page.extract_text() or '' for page in reader.pages]
-            texts.append('\n'.join(parts))
-    return texts
+    return [load_file(p) for p in list_files(corpus_dir)]
+
+class DocumentLoader:
+    def __init__(self, workers=None, cache_dir=None, lookahead=None):
+        self.workers=workers or os.cpu_count() or 1; self.lookahead=lookahead or 2*self.workers
+        self.cache_dir=Path(cache_dir) if cache_dir else None
+        if self.cache_dir: self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.stats={'files':0,'cache_hits':0,'tasks':0}
+    def _submit(self, pool, p: Path, sha: str | None):
+        cached=self.cache_dir/f'{sha}.txt' if self.cache_dir and sha else None
+        if cached and cached.exists(): self.stats['cache_hits']+=1; return cached, None
+        suffix=p.suffix.lower()
+        if suffix=='.pdf':
+            n=len(PdfReader(str(p)).pages); step=PDF_PAGES_PER_TASK if n>2*PDF_PAGES_PER_TASK else n or 1
+            futs=[pool.submit(extract_pdf_pages, str(p), i, i+step) for i in range(0, max(n, 1), step)]
+        elif suffix in UNSTRUCTURED_SUFFIXES:
+            futs=[pool.submit(extract_unstructured, str(p))]
+        else:
+            return None, None
+        self.stats['tasks']+=len(futs); return cached, futs
+    def _pieces(self, p: Path, cached, futs):
+        if futs is None:
+            yield from _read_blocks(cached or p); return
+        parts=[]
+        for i,f in enumerate(futs):
+            part=('\n' if i else '')+f.result(); parts.append(part); yield part
+        self._store(cached, parts)
+    def _inline(self, p: Path, sha: str | None):
+        cached=self.cache_dir/f'{sha}.txt' if self.cache_dir and sha else None
+        if cached and cached.exists(): self.stats['cache_hits']+=1; yield from _read_blocks(cached); return
+        if p.suffix.lower() in TEXT_SUFFIXES: yield from _read_blocks(p); return
+        parts=[]
+        for part in iter_file_text(p): parts.append(part); yield part
+        self._store(cached, parts)
+    def _store(self, cached, parts):
+        if cached:
+            tmp=cached.with_suffix(f'.{os.getpid()}.tmp'); tmp.write_text(''.join(parts), encoding='utf-8'); os.replace(tmp, cached)
+    def iter_documents(self, files):
+        if self.workers==1:
+            for p, sha in files: self.stats['files']+=1; yield p, self._inline(p, sha)
+            return
+        files=iter(files); pending=deque()
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=mp.get_context('spawn')) as pool:
+            def fill():
+                while len(pending)<self.lookahead:
+                    item=next(files, None)
+                    if item is None: return
+                    p, sha = item; pending.append((p, sha, *self._submit(pool, p, sha)))
+            fill()
+            while pending:
+                p, sha, cached, futs = pending.popleft(); fill(); self.stats['files']+=1
+                yield p, self._pieces(p, cached, futs)
@@ -1,19 +1,114 @@
-import json, faiss
+import faiss, os, re, threading
+import numpy as np
+from collections import OrderedDict
 from pathlib import Path
-from sentence_transformers import SentenceTransformer
+from .registry import get_encoder, index_version, registry
+from .ann import rerank, search_params
+from .store import LOCAL_MASK, TENANT_BITS
 MODEL='sentence-transformers/all-MiniLM-L6-v2'
+
+def normalize(text: str) -> str:
+    return ' '.join(re.sub(r'[^\w\s]', ' ', text.lower()).split())
+
+class LRU:
+    def __init__(self, size=1024):
+        self.size=size; self.data=OrderedDict(); self.lock=threading.Lock(); self.hits=0; self.misses=0
+    def get(self, key):
+        with self.lock:
+            if key in self.data: self.data.move_to_end(key); self.hits+=1; return self.data[key]
+            self.misses+=1; return None
+    def put(self, key, value):
+        with self.lock:
+            self.data[key]=value; self.data.move_to_end(key)
+            while len(self.data)>self.size: self.data.popitem(last=False)
+
+embeddings=LRU(int(os.getenv('RAG_EMBED_CACHE_SIZE','4096'))); results=LRU(int(os.getenv('RAG_RESULT_CACHE_SIZE','4096')))
+TENANT_SCAN_MAX=int(os.getenv('RAG_TENANT_SCAN_MAX','20000'))
+class IndexView:
+    """A pinned index entry as one session searches it; for a shared index, restricted to one tenant's rows."""
+    def __init__(self, entry, nprobe=None, ef_search=None, rerank_factor=8, tenant=None):
+        self.entry=entry; self.index=entry.index; self.chunks=entry.chunks; self.version=(str(entry.base_dir), entry.version)
+        self.tenant=tenant; self.rows=self.sel=self.source=None
+        if tenant is not None:
+            t=(entry.tenants or {}).get(tenant)
+            if t is None: raise KeyError(f'{tenant} is not in {entry.base_dir}')
+            self.rows=(t['start'], t['end']); self.source=tuple(t['source'])
+            self.sel=faiss.IDSelectorRange(t['tenant']<<TENANT_BITS, (t['tenant']+1)<<TENANT_BITS)
+        self.params=search_params(self.index, nprobe, ef_search, self.sel); self.overfetch=2 if entry.holes else 1
+        self.vectors=entry.vectors if entry.vectors is not None and len(entry.vectors) else None
+        self.rerank=self.vectors is not None and entry.kind=='ivfpq'
+        if self.rerank: self.overfetch*=rerank_factor
+    @property
+    def scan(self) -> bool:
+        return self.rows is not None and self.rows[1]-self.rows[0]<=TENANT_SCAN_MAX
+
 class RAG:
-    def __init__(self, backend='faiss', base_dir='data/indexes/default', pinecone_conf=None):
-        self.backend=backend; self.base_dir=Path(base_dir); self.model=SentenceTransformer(MODEL)
+    def __init__(self, backend='faiss', base_dir='data/indexes/default', pinecone_conf=None, nprobe=None, ef_search=None, rerank_factor=8, tenant=None):
+        self.backend=backend; self.base_dir=Path(base_dir); self.model=get_encoder(MODEL); self.tenant=tenant
+        self.opts=(nprobe, ef_search, rerank_factor); self.lock=threading.Lock(); self.view=self.pending=None; self.swaps=0
         if backend=='faiss':
-            self.index=faiss.read_index(str(self.base_dir/'faiss.index'))
-            self.meta=json.loads((self.base_dir/'meta.json').read_text())
+            self.view=self._open(self.base_dir, tenant)
         elif backend=='pinecone':
             import pinecone; pinecone.init(api_key=pinecone_conf['api_key'], environment=pinecone_conf['env']); self.index=pinecone.Index(pinecone_conf['index'])
         else: raise ValueError('backend must be faiss or pinecone')
+    @property
+    def version(self):
+        return self.view.version if self.view else None
+    def refresh(self, base_dir=None, tenant=...) -> bool:
+        """Load a newer index for base_dir (default: the current one) without touching the live view; swap() installs it.
+        `tenant` moves the session onto (or, with None, off) a shared index; it defaults to the current one."""
+        if self.backend!='faiss': return False
+        base_dir=Path(base_dir or self.base_dir); tenant=self.tenant if tenant is ... else tenant
+        try: version=index_version(base_dir)
+        except FileNotFoundError: return False
+        current=self.pending or self.view
+        if version==current.version and tenant==current.tenant: return False
+        view=self._open(base_dir, tenant)
+        with self.lock: stale, self.pending, self.base_dir, self.tenant = self.pending, view, base_dir, tenant
+        if stale: registry.release(stale.entry)
+        return True
+    def swap(self) -> bool:
+        with self.lock:
+            view, self.pending = self.pending, None
+            if view is None: return False
+            old, self.view = self.view, view; self.swaps+=1
+        registry.release(old.entry); return True
+    def close(self):
+        with self.lock: views=[v for v in (self.view, self.pending) if v]; self.view=self.pending=None
+        for v in views: registry.release(v.entry)
+    def _open(self, base_dir, tenant) -> IndexView:
+        entry=registry.acquire(base_dir)
+        try: return IndexView(entry, *self.opts, tenant=tenant)
+        except BaseException: registry.release(entry); raise
+    def _pin(self) -> IndexView:
+        with self.lock: view=self.view; registry.retain(view.entry); return view
+    def embed(self, query: str, norm: str):
+        q=embeddings.get(norm)
+        if q is None:
+            q=self.model.encode([query], convert_to_numpy=True); faiss.normalize_L2(q); embeddings.put(norm, q)
+        return q
     def topk(self, query: str, k=4):
-        q=self.model.encode([query], convert_to_numpy=True); faiss.normalize_L2(q)
+        norm=normalize(query)
+        if self.backend!='faiss': return self._search(query, norm, k)
+        key=(self.view.version, self.view.tenant, norm, k); hit=results.get(key)
+        if hit is None:
+            view=self._pin()
+            try: hit=self._search(query, norm, k, view)
+            finally: registry.release(view.entry)
+            results.put((view.version, view.tenant, norm, k), hit)
+        return hit
+    def _search(self, query: str, norm: str, k: int, view: IndexView | None = None):
+        q=self.embed(query, norm)
+        if self.backend=='faiss' and view.scan:
+            start, end = view.rows
+            if start==end: return []
+            scores=np.asarray(view.vectors[start:end], dtype='float32')@q.ravel().astype('float32')
+            top=np.argpartition(-scores, k)[:k] if len(scores)>k else np.arange(len(scores)); top=top[np.argsort(-scores[top])]
+            return [(view.chunks[start+i], float(scores[i])) for i in top.tolist()]
         if self.backend=='faiss':
-            D,I=self.index.search(q.astype('float32'), k); texts=[self.meta['texts'][i] for i in I[0]]; return list(zip(texts, D[0].tolist()))
+            D,I=view.index.search(q.astype('float32'), k*view.overfetch, params=view.params)
+            if view.rows is not None: I=np.where(I>=0, view.rows[0]+(I&LOCAL_MASK), -1)
+            if view.rerank: d,i=rerank(view.vectors, q, I[0], k*view.overfetch); D,I=d[None,:],i[None,:]
+            hits=[(view.chunks[i], d) for i,d in zip(I[0].tolist(), D[0].tolist()) if i>=0]; return [h for h in hits if h[0] is not None][:k]
         else:
             res=self.index.query(vector=q[0].tolist(), top_k=k, include_metadata=True); return [(m['metadata']['text'], m['score']) for m in res['matches']]
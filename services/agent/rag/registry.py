@@ -0,0 +1,92 @@
+import json, os, threading, time
+from collections import OrderedDict
+from pathlib import Path
+import faiss
+from .encoders import load_encoder
+from .store import TENANTS, ChunkStore, open_vectors
+from .ann import kind_of
+
+_encoders={}; _encoder_lock=threading.Lock()
+
+def get_encoder(name: str):
+    with _encoder_lock:
+        model=_encoders.get(name)
+        if model is None:
+            t0=time.perf_counter(); model=_encoders[name]=load_encoder(name)
+            registry.stats['encoder_load_s']+=time.perf_counter()-t0
+        return model
+
+class IndexEntry:
+    def __init__(self, base_dir: Path):
+        self.base_dir=base_dir; self.version=(base_dir/'faiss.index').stat().st_mtime_ns
+        self.tenants=json.loads((base_dir/TENANTS).read_text()) if (base_dir/TENANTS).exists() else None
+        self.index=faiss.read_index(str(base_dir/'faiss.index'), faiss.IO_FLAG_MMAP if self.tenants is not None else 0)
+        self.chunks=ChunkStore(base_dir); self.kind=kind_of(self.index)
+        self.vectors=open_vectors(base_dir, self.index.d) if self.kind=='ivfpq' or self.tenants is not None else None
+        self.holes=int((self.chunks.offsets[:,1]<0).sum()) if len(self.chunks) else 0
+        self.nbytes=(base_dir/'faiss.index').stat().st_size + self.chunks.nbytes
+        self.refs=0; self.retired=False
+    def close(self):
+        self.chunks.close(); self.index=None; self.vectors=None
+
+def index_version(base_dir) -> tuple[str, int]:
+    key=Path(base_dir).resolve(); return str(key), (key/'faiss.index').stat().st_mtime_ns
+
+class IndexRegistry:
+    def __init__(self, max_entries=64, max_mb=1024):
+        self.max_entries=max_entries; self.max_bytes=max_mb*1024*1024
+        self.entries: OrderedDict[str, IndexEntry] = OrderedDict(); self.nbytes=0; self.links: dict[str, str] = {}
+        self.lock=threading.Lock(); self._loading: dict[str, threading.Event] = {}
+        self.stats={'hits':0,'misses':0,'evictions':0,'loads':0,'load_s':0.0,'encoder_load_s':0.0,'retired':0,'freed':0}
+    def acquire(self, base_dir) -> IndexEntry:
+        """Pinned get that first retires entries superseded by a new symlink target or a rewritten faiss.index."""
+        link=str(Path(base_dir).absolute()); key, version = index_version(base_dir)
+        with self.lock:
+            prev=self.links.get(link); self.links[link]=key
+            if prev and prev!=key: self._retire(prev)
+            entry=self.entries.get(key)
+            if entry is not None and entry.version!=version: self._retire(key)
+        return self.get(base_dir, pin=True)
+    def release(self, entry: IndexEntry):
+        with self.lock:
+            entry.refs-=1; free=entry.refs==0 and entry.retired
+            if free: self.stats['freed']+=1
+        if free: entry.close()
+    def retain(self, entry: IndexEntry):
+        with self.lock: entry.refs+=1
+    def _retire(self, key: str, reason='retired'):
+        old=self.entries.pop(key, None)
+        if old is None: return
+        self.nbytes-=old.nbytes; old.retired=True; self.stats[reason]+=1
+        if old.refs==0: old.close(); self.stats['freed']+=1
+    def get(self, base_dir, pin=False) -> IndexEntry:
+        key=str(Path(base_dir).resolve())
+        while True:
+            with self.lock:
+                entry=self.entries.get(key)
+                if entry is not None:
+                    self.entries.move_to_end(key); self.stats['hits']+=1; entry.refs+=pin; return entry
+                pending=self._loading.get(key)
+                if pending is None:
+                    self._loading[key]=threading.Event(); self.stats['misses']+=1; break
+            pending.wait()
+        try:
+            t0=time.perf_counter(); entry=IndexEntry(Path(key)); dt=time.perf_counter()-t0
+            with self.lock:
+                self.entries[key]=entry; self.nbytes+=entry.nbytes; entry.refs+=pin
+                self.stats['loads']+=1; self.stats['load_s']+=dt; self._evict()
+            return entry
+        finally:
+            with self.lock: self._loading.pop(key).set()
+    def _evict(self):
+        while len(self.entries)>1 and (len(self.entries)>self.max_entries or self.nbytes>self.max_bytes):
+            self._retire(next(iter(self.entries)), 'evictions')
+    def invalidate(self, base_dir):
+        with self.lock: self._retire(str(Path(base_dir).resolve()))
+    def snapshot(self) -> dict:
+        with self.lock:
+            lookups=self.stats['hits']+self.stats['misses']
+            return {**self.stats, 'entries':len(self.entries), 'bytes':self.nbytes,
+                    'hit_rate': self.stats['hits']/lookups if lookups else 0.0}
+
+registry=IndexRegistry(max_entries=int(os.getenv('RAG_INDEX_CACHE_SIZE','64')), max_mb=int(os.getenv('RAG_INDEX_CACHE_MB','1024')))
@@ -0,0 +1,102 @@
+import fcntl, json, mmap, os
+import numpy as np
+from pathlib import Path
+BLOB='chunks.bin'; OFFSETS='chunks.idx.npy'
+
+def _save_offsets(base: Path, offsets: np.ndarray):
+    tmp=base/f'{OFFSETS}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f: np.save(f, offsets)
+    os.replace(tmp, base/OFFSETS)
+
+def exists(base_dir) -> bool:
+    base=Path(base_dir); return (base/OFFSETS).exists() or (base/'meta.json').exists()
+
+def convert_meta(base_dir):
+    """Rewrite a legacy meta.json as the chunk store; shards opening the same index convert it once, under a file lock."""
+    base=Path(base_dir)
+    with open(base/'chunks.lock', 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if (base/OFFSETS).exists(): return
+        w=ChunkStoreWriter(base, fresh=True)
+        for t in json.loads((base/'meta.json').read_text())['texts']:
+            if t is None: w.offsets.append((0, -1))
+            else: w.add(t)
+        w.commit()
+
+class ChunkStore:
+    def __init__(self, base_dir):
+        base=Path(base_dir)
+        if not (base/OFFSETS).exists(): convert_meta(base)
+        self.offsets=np.load(base/OFFSETS, mmap_mode='r')
+        self._f=open(base/BLOB, 'rb'); size=os.fstat(self._f.fileno()).st_size
+        self._mm=mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+        self.view=memoryview(self._mm) if self._mm else memoryview(b'')
+        self.nbytes=self.offsets.nbytes
+    def __len__(self):
+        return len(self.offsets)
+    def __getitem__(self, i):
+        start, n = self.offsets[i]
+        return None if n<0 else str(self.view[start:start+n], 'utf-8')
+    def close(self):
+        self.view.release()
+        if self._mm: self._mm.close()
+        self._f.close()
+
+class ChunkStoreWriter:
+    def __init__(self, base_dir, fresh=False):
+        self.base=Path(base_dir); self.base.mkdir(parents=True, exist_ok=True); self.fresh=fresh or not (self.base/OFFSETS).exists()
+        self.path=self.base/(f'{BLOB}.{os.getpid()}.tmp' if self.fresh else BLOB)
+        self.offsets=[] if self.fresh else [tuple(r) for r in np.load(self.base/OFFSETS).tolist()]
+        self.blob=open(self.path, 'wb' if self.fresh else 'ab'); self.pos=self.blob.tell()
+    def __len__(self):
+        return len(self.offsets)
+    def add(self, text: str) -> int:
+        data=text.encode('utf-8'); self.blob.write(data)
+        self.offsets.append((self.pos, len(data))); self.pos+=len(data)
+        return len(self.offsets)-1
+    def delete(self, ids):
+        for i in ids: self.offsets[i]=(0, -1)
+    def holes(self) -> int:
+        return sum(1 for _,n in self.offsets if n<0)
+    def live_ids(self):
+        return [i for i,(_,n) in enumerate(self.offsets) if n>=0]
+    def compact(self):
+        self.blob.close(); live=self.live_ids(); src_path=self.path; self.path=self.base/f'{BLOB}.{os.getpid()}.compact'
+        with open(src_path, 'rb') as src, open(self.path, 'wb') as dst:
+            offsets=[]; pos=0
+            for i in live:
+                start, n = self.offsets[i]; src.seek(start); dst.write(src.read(n)); offsets.append((pos, n)); pos+=n
+        if self.fresh: os.remove(src_path)
+        self.fresh=True; self.offsets=offsets; self.blob=open(self.path, 'ab'); self.pos=pos
+        return {old:new for new,old in enumerate(live)}
+    def commit(self):
+        self.blob.close()
+        if self.fresh: os.replace(self.path, self.base/BLOB)
+        _save_offsets(self.base, np.array(self.offsets, dtype='int64').reshape(-1, 2))
+
+VECTORS='vectors.f32'
+TENANTS='tenants.json'; TENANT_BITS=32; LOCAL_MASK=(1<<TENANT_BITS)-1
+def open_vectors(base_dir, dim: int):
+    path=Path(base_dir)/VECTORS; n=path.stat().st_size//(4*dim) if path.exists() else 0
+    return np.memmap(path, dtype='float32', mode='r', shape=(n, dim)) if n else np.zeros((0, dim), dtype='float32')
+
+class VectorWriter:
+    def __init__(self, base_dir, dim: int, fresh=False):
+        self.base=Path(base_dir); self.dim=dim; self.fresh=fresh or not (self.base/VECTORS).exists()
+        self.path=self.base/(f'{VECTORS}.{os.getpid()}.tmp' if self.fresh else VECTORS)
+        self.f=open(self.path, 'wb' if self.fresh else 'ab'); self.rows=self.f.tell()//(4*dim)
+    def append(self, embs: np.ndarray):
+        self.f.write(np.ascontiguousarray(embs, dtype='float32').tobytes()); self.rows+=len(embs)
+    def view(self):
+        self.f.flush()
+        return np.memmap(self.path, dtype='float32', mode='r', shape=(self.rows, self.dim)) if self.rows else np.zeros((0, self.dim), dtype='float32')
+    def compact(self, live):
+        src=self.view(); self.f.close(); tmp=self.base/(VECTORS+'.compact')
+        with open(tmp, 'wb') as f:
+            for i in range(0, len(live), 65536): f.write(np.ascontiguousarray(src[live[i:i+65536]]).tobytes())
+        del src
+        if self.fresh: os.remove(self.path)
+        self.fresh=True; self.path=tmp; self.f=open(tmp, 'ab'); self.rows=len(live)
+    def commit(self):
+        self.f.close()
+        if self.fresh: os.replace(self.path, self.base/VECTORS)
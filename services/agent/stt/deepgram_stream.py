@@ -1,20 +1,66 @@
-import json, websockets
+import asyncio, json, time, websockets
+from metrics import metrics
+from dataclasses import dataclass
+DEEPGRAM_URL='wss://api.deepgram.com/v1/listen'
+
+@dataclass
+class TranscriptEvent:
+    text: str
+    is_final: bool
+    speech_final: bool = False
+
 class DeepgramStreamSTT:
-    def __init__(self, api_key: str, sample_rate=16000):
-        self.api_key=api_key; self.sample_rate=sample_rate; self.ws=None
+    def __init__(self, api_key: str, sample_rate=16000, url=DEEPGRAM_URL, max_pending=256, keepalive_s=5.0):
+        self.api_key=api_key; self.sample_rate=sample_rate; self.url=url; self.ws=None
+        self.max_pending=max_pending; self.keepalive_s=keepalive_s; self.sent_bytes=0; self.dropped=0; self.error=None; self.finalize_t=None
     async def __aenter__(self):
         self.ws = await websockets.connect(
-            uri=f'wss://api.deepgram.com/v1/listen?model=nova-2&encoding=linear16&sample_rate={self.sample_rate}&punctuate=true&interim_results=true',
+            uri=f'{self.url}?model=nova-2&encoding=linear16&sample_rate={self.sample_rate}&punctuate=true&interim_results=true',
             extra_headers={'Authorization': f'Token {self.api_key}'} )
+        self._audio: asyncio.Queue = asyncio.Queue(maxsize=self.max_pending); self._events: asyncio.Queue = asyncio.Queue()
+        self._sender=asyncio.create_task(self._send_loop()); self._receiver=asyncio.create_task(self._recv_loop())
         return self
     async def __aexit__(self, *args):
-        if self.ws: await self.ws.close()
+        if self.ws:
+            self._sender.cancel(); self._receiver.cancel()
+            await asyncio.gather(self._sender, self._receiver, return_exceptions=True)
+            try: await self.ws.send(json.dumps({'type':'CloseStream'}))
+            except websockets.ConnectionClosed: pass
+            await self.ws.close()
     async def send_pcm(self, pcm_bytes: bytes):
-        await self.ws.send(pcm_bytes)
-    async def recv_transcript(self):
-        data = json.loads(await self.ws.recv())
-        if 'channel' in data.get('results',{}):
-            alts = data['results']['channel']['alternatives']
-            if alts:
-                return alts[0].get('transcript',''), data['results'].get('is_final', False)
-        return '', False
+        if self._audio.full(): self._audio.get_nowait(); self.dropped+=1
+        self._audio.put_nowait(pcm_bytes)
+    async def finalize(self):
+        self.finalize_t=time.perf_counter(); await self.send_pcm(json.dumps({'type':'Finalize'}))
+    async def _send_loop(self):
+        try:
+            while True:
+                try: pcm=await asyncio.wait_for(self._audio.get(), self.keepalive_s)
+                except asyncio.TimeoutError: pcm=json.dumps({'type':'KeepAlive'})
+                await self.ws.send(pcm)
+                if isinstance(pcm, bytes): self.sent_bytes+=len(pcm)
+        except websockets.ConnectionClosed as e:
+            self.error=e; self._events.put_nowait(None)
+    async def _recv_loop(self):
+        try:
+            async for raw in self.ws:
+                data=json.loads(raw)
+                if 'channel' in data and data.get('type','Results')=='Results':
+                    alts=data['channel']['alternatives']
+                    if data.get('is_final') and self.finalize_t is not None:
+                        metrics.observe('stt_finalize', (time.perf_counter()-self.finalize_t)*1000); self.finalize_t=None
+                    if alts and alts[0].get('transcript'):
+                        self._events.put_nowait(TranscriptEvent(alts[0]['transcript'], data.get('is_final', False), data.get('speech_final', False)))
+        except websockets.ConnectionClosed as e:
+            self.error=e
+        finally:
+            self._events.put_nowait(None)
+    def __aiter__(self):
+        return self
+    async def __anext__(self) -> TranscriptEvent:
+        ev=await self._events.get()
+        if ev is None:
+            self._events.put_nowait(None)
+            if self.error and not isinstance(self.error, websockets.ConnectionClosedOK): raise self.error
+            raise StopAsyncIteration
+        return ev
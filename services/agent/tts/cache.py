@@ -0,0 +1,82 @@
+import asyncio, fcntl, hashlib, json, os, threading, unicodedata
+from pathlib import Path
+from .pool import MODEL, TtsPool
+
+def normalize(text: str) -> str:
+    return ' '.join(unicodedata.normalize('NFC', text).split())
+
+class AudioCache:
+    """Phrase audio on disk, shared by every shard process. LRU order is file mtime (bumped on each hit), and the
+    size budget is enforced against the directory itself under a file lock, so it holds across processes."""
+    def __init__(self, root, max_mb=256, chunk=3200):
+        self.root=Path(root); self.root.mkdir(parents=True, exist_ok=True); self.max_bytes=max_mb*1024*1024; self.chunk=chunk
+        self.lock=threading.Lock(); self.files=0; self.nbytes=0
+        self.inflight: dict[str, asyncio.Future] = {}
+        self.stats={'hits':0,'misses':0,'writes':0,'evictions':0,'evicted_under_read':0}
+        self._evict()
+    def key(self, voice_id: str, text: str, model=MODEL, voice_settings=None, output_format='pcm_16000') -> str:
+        ident=json.dumps([voice_id, model, voice_settings or {}, output_format, normalize(text)], sort_keys=True)
+        return hashlib.sha256(ident.encode('utf-8')).hexdigest()
+    def _path(self, key: str) -> Path:
+        return self.root/key[:2]/f'{key}.pcm'
+    def lookup(self, key: str) -> Path | None:
+        path=self._path(key)
+        try: os.utime(path)
+        except FileNotFoundError:
+            with self.lock: self.stats['misses']+=1
+            return None
+        with self.lock: self.stats['hits']+=1
+        return path
+    def put(self, key: str, pcm: bytes):
+        path=self._path(key); path.parent.mkdir(exist_ok=True); tmp=path.with_suffix(f'.{os.getpid()}.tmp')
+        tmp.write_bytes(pcm); os.replace(tmp, path)
+        with self.lock: self.stats['writes']+=1
+        self._evict()
+    def _evict(self):
+        """Delete the least recently used files until the directory fits the budget, always keeping the newest one."""
+        with open(self.root/'.lock', 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX); files=[]
+            for p in self.root.glob('*/*.pcm'):
+                try: st=p.stat()
+                except FileNotFoundError: continue
+                files.append((st.st_mtime, st.st_size, p))
+            files.sort(); total=sum(n for _,n,_ in files); evicted=0
+            for _, n, p in files[:-1]:
+                if total<=self.max_bytes: break
+                try: os.remove(p)
+                except FileNotFoundError: pass
+                total-=n; evicted+=1
+        with self.lock: self.files=len(files)-evicted; self.nbytes=total; self.stats['evictions']+=evicted
+    async def read(self, pool: TtsPool, voice_id: str, text: str, model=MODEL):
+        """PCM chunks of the phrase. Once open the file survives eviction; if another shard evicts it between
+        lookup and open, it is synthesized again (once)."""
+        for retry in (False, True):
+            path=await self.ensure(pool, voice_id, text, model)
+            try:
+                f=open(path, 'rb'); break
+            except FileNotFoundError:
+                if retry: raise
+                with self.lock: self.stats['evicted_under_read']+=1
+        with f:
+            while chunk:=await asyncio.to_thread(f.read, self.chunk): yield chunk
+    async def ensure(self, pool: TtsPool, voice_id: str, text: str, model=MODEL) -> Path:
+        key=self.key(voice_id, text, model, pool.voice_settings, pool.output_format)
+        if path:=self.lookup(key): return path
+        if key in self.inflight: return await asyncio.shield(self.inflight[key])
+        fut=self.inflight[key]=asyncio.get_running_loop().create_future()
+        try:
+            async with pool.stream(voice_id, model) as tts:
+                await tts.send_text(normalize(text)); await tts.end(); pcm=b''.join([c async for c in tts.recv_audio()])
+            await asyncio.to_thread(self.put, key, pcm); fut.set_result(self._path(key)); return self._path(key)
+        except BaseException as e:
+            if isinstance(e, asyncio.CancelledError): fut.cancel()
+            else: fut.set_exception(e); fut.exception()
+            raise
+        finally:
+            self.inflight.pop(key, None)
+    def snapshot(self) -> dict:
+        with self.lock:
+            lookups=self.stats['hits']+self.stats['misses']
+            return {**self.stats, 'entries':self.files, 'bytes':self.nbytes, 'hit_rate': self.stats['hits']/lookups if lookups else 0.0}
+
+cache=AudioCache(os.getenv('TTS_CACHE_DIR','data/cache/tts'), max_mb=int(os.getenv('TTS_CACHE_MB','256')))
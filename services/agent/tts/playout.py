@@ -0,0 +1,24 @@
+from livekit import rtc
+
+class RoomAudioOut:
+    def __init__(self, room: rtc.Room, sample_rate=16000, channels=1, frame_ms=20):
+        self.room=room; self.sample_rate=sample_rate; self.channels=channels
+        self.frame_bytes=sample_rate*frame_ms//1000*2*channels; self.source=None; self.rest=b''; self.played_bytes=0
+    async def start(self, name='agent-voice'):
+        self.source=rtc.AudioSource(self.sample_rate, self.channels)
+        track=rtc.LocalAudioTrack.create_audio_track(name, self.source)
+        await self.room.local_participant.publish_track(track, rtc.TrackPublishOptions(source=rtc.TrackSource.SOURCE_MICROPHONE))
+        return self
+    async def play(self, pcm: bytes):
+        buf=self.rest+pcm; n=len(buf)-len(buf)%self.frame_bytes; self.rest=buf[n:]
+        for i in range(0, n, self.frame_bytes): await self._capture(buf[i:i+self.frame_bytes])
+    async def flush(self):
+        rest, self.rest = self.rest, b''
+        if rest: await self._capture(rest[:len(rest)-len(rest)%(2*self.channels)])
+    async def _capture(self, data: bytes):
+        if not data: return
+        await self.source.capture_frame(rtc.AudioFrame(data, self.sample_rate, self.channels, len(data)//(2*self.channels)))
+        self.played_bytes+=len(data)
+    def clear(self):
+        self.rest=b''
+        if self.source is not None and hasattr(self.source, 'clear_queue'): self.source.clear_queue()
@@ -0,0 +1,106 @@
+import asyncio, base64, json, os, time, uuid, websockets
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from metrics import metrics
+ELEVEN_URL='wss://api.elevenlabs.io/v1/text-to-speech/{voice_id}/multi-stream-input'
+MODEL='eleven_multilingual_v2'
+VOICE_SETTINGS={'stability':0.4,'similarity_boost':0.7}
+
+class TtsConnection:
+    def __init__(self, ws, key):
+        self.ws=ws; self.key=key; self.created=self.last_used=time.monotonic(); self.uses=0
+        self.contexts: dict[str, asyncio.Queue] = {}; self.reader=asyncio.create_task(self._read())
+    @property
+    def alive(self) -> bool:
+        return not self.reader.done()
+    async def send(self, msg: dict):
+        await self.ws.send(json.dumps(msg))
+    async def _read(self):
+        try:
+            async for raw in self.ws:
+                msg=json.loads(raw); q=self.contexts.get(msg.get('contextId', msg.get('context_id')))
+                if q is None: continue
+                if msg.get('audio'): q.put_nowait(base64.b64decode(msg['audio']))
+                if msg.get('isFinal'): q.put_nowait(None)
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            for q in self.contexts.values(): q.put_nowait(ConnectionError('TTS connection closed mid-stream'))
+    async def close(self):
+        self.reader.cancel(); await self.ws.close()
+
+class TtsContext:
+    def __init__(self, conn: TtsConnection, voice_settings: dict):
+        self.conn=conn; self.id=uuid.uuid4().hex; self.voice_settings=voice_settings; self.queue=asyncio.Queue(); self.finished=False; self.sent_t=None
+    async def open(self):
+        self.conn.contexts[self.id]=self.queue
+        await self.conn.send({'text':' ','voice_settings':self.voice_settings,'context_id':self.id})
+    async def send_text(self, text: str, flush=True):
+        if self.sent_t is None: self.sent_t=time.perf_counter()
+        await self.conn.send({'text':text,'context_id':self.id})
+        if flush: await self.conn.send({'context_id':self.id,'flush':True})
+    async def end(self):
+        await self.conn.send({'context_id':self.id,'flush':True}); await self.conn.send({'context_id':self.id,'close_context':True})
+    async def recv_audio(self):
+        while True:
+            item=await self.queue.get()
+            if item is None: self.finished=True; return
+            if isinstance(item, Exception): raise item
+            if self.sent_t is not None:
+                metrics.observe('tts_first_audio', (time.perf_counter()-self.sent_t)*1000); self.sent_t=None
+            yield item
+    async def cancel(self):
+        if self.finished or not self.conn.alive: return
+        try: await self.conn.send({'context_id':self.id,'close_context':True})
+        except websockets.ConnectionClosed: pass
+    def detach(self):
+        self.conn.contexts.pop(self.id, None)
+
+class TtsPool:
+    def __init__(self, api_key: str, max_idle_s=150.0, max_per_key=2, url=ELEVEN_URL, output_format='pcm_16000', voice_settings=VOICE_SETTINGS):
+        self.api_key=api_key; self.max_idle_s=max_idle_s; self.max_per_key=max_per_key; self.url=url
+        self.output_format=output_format; self.voice_settings=voice_settings
+        self.idle: dict[tuple, list[TtsConnection]] = defaultdict(list)
+        self.stats={'connects':0,'reuses':0,'expired':0,'broken':0,'in_use':0}
+    @property
+    def sample_rate(self) -> int:
+        return int(self.output_format.split('_')[1])
+    async def _connect(self, voice_id: str, model: str) -> TtsConnection:
+        url=self.url.format(voice_id=voice_id)+f'?model_id={model}&output_format={self.output_format}&inactivity_timeout={int(self.max_idle_s)+30}'
+        with metrics.span('tts_connect'):
+            ws=await websockets.connect(url, extra_headers={'xi-api-key': self.api_key})
+        self.stats['connects']+=1
+        return TtsConnection(ws, (voice_id, model))
+    async def acquire(self, voice_id: str, model=MODEL) -> TtsConnection:
+        idle=self.idle[(voice_id, model)]; now=time.monotonic()
+        while idle:
+            conn=idle.pop()
+            if conn.alive and now-conn.last_used<self.max_idle_s:
+                self.stats['reuses']+=1; break
+            self.stats['expired' if conn.alive else 'broken']+=1; await conn.close()
+        else:
+            conn=await self._connect(voice_id, model)
+        conn.uses+=1; self.stats['in_use']+=1; return conn
+    async def release(self, conn: TtsConnection):
+        self.stats['in_use']-=1; idle=self.idle[conn.key]
+        if not conn.alive or len(idle)>=self.max_per_key:
+            self.stats['broken']+=not conn.alive; await conn.close(); return
+        conn.last_used=time.monotonic(); idle.append(conn)
+    @asynccontextmanager
+    async def stream(self, voice_id: str, model=MODEL):
+        conn=await self.acquire(voice_id, model); ctx=TtsContext(conn, self.voice_settings)
+        try:
+            await ctx.open(); yield ctx
+        finally:
+            await ctx.cancel(); ctx.detach(); await self.release(conn)
+    async def warm(self, voice_id: str, model=MODEL):
+        if not self.idle[(voice_id, model)]: await self.release(await self.acquire(voice_id, model))
+    async def close(self):
+        for conns in self.idle.values():
+            for conn in conns: await conn.close()
+        self.idle.clear()
+    def snapshot(self) -> dict:
+        total=self.stats['connects']+self.stats['reuses']
+        return {**self.stats, 'idle':sum(len(v) for v in self.idle.values()), 'reuse_rate': self.stats['reuses']/total if total else 0.0}
+
+pool=TtsPool(os.getenv('ELEVENLABS_API_KEY',''), url=os.getenv('ELEVENLABS_WS_URL', ELEVEN_URL), max_idle_s=float(os.getenv('TTS_POOL_IDLE_S','150')), max_per_key=int(os.getenv('TTS_POOL_PER_VOICE','2')))
@@ -1,4 +1,6 @@
-import torch, torchaudio
+import asyncio, torch, torchaudio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 class SileroVAD:
     def __init__(self, sampling_rate=16000, threshold=0.5):
         self.model, self.utils = torch.hub.load('snakers4/silero-vad','silero_vad',force_reload=False)
@@ -9,3 +11,33 @@ class SileroVAD:
         with torch.no_grad():
             probs = self.model(audio, self.sr).item()
         return probs > self.threshold, probs
+    def window_probs(self, pcm: bytes, window=512):
+        audio = torch.frombuffer(bytearray(pcm), dtype=torch.int16).float() / 32768.0
+        with torch.no_grad():
+            return [self.model(audio[i:i+window], self.sr).item() for i in range(0, len(audio)-window+1, window)]
+
+class VadGate:
+    def __init__(self, vad: SileroVAD, chunk_ms: int, preroll_ms=300, hangover_ms=600):
+        self.vad=vad; self.chunk_ms=chunk_ms; self.hangover_ms=hangover_ms
+        self.preroll: deque[bytes] = deque(maxlen=max(1, preroll_ms//chunk_ms))
+        self.executor=ThreadPoolExecutor(max_workers=1, thread_name_prefix='vad')
+        self.pending=b''; self.in_speech=False; self.silence_ms=0
+        self.stats={'chunks':0,'speech_chunks':0,'segments':0}
+    async def process(self, chunk: bytes) -> tuple[list[bytes], str | None]:
+        self.stats['chunks']+=1
+        window_bytes=512*2; data=self.pending+chunk; usable=len(data)-len(data)%window_bytes; self.pending=data[usable:]
+        probs=await asyncio.get_running_loop().run_in_executor(self.executor, self.vad.window_probs, data[:usable])
+        voiced=any(p>self.vad.threshold for p in probs)
+        if not self.in_speech:
+            if not voiced:
+                self.preroll.append(chunk); return [], None
+            self.in_speech=True; self.silence_ms=0; self.stats['segments']+=1
+            out=list(self.preroll)+[chunk]; self.preroll.clear(); self.stats['speech_chunks']+=len(out)
+            return out, 'start'
+        self.stats['speech_chunks']+=1
+        self.silence_ms=0 if voiced else self.silence_ms+self.chunk_ms
+        if self.silence_ms>=self.hangover_ms:
+            self.in_speech=False; return [chunk], 'end'
+        return [chunk], None
+    def close(self):
+        self.executor.shutdown(wait=False)
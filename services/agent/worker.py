@@ -1,68 +1,232 @@
-import asyncio, os, requests
+import asyncio, difflib, os, requests, threading, time
+from contextlib import aclosing
 from livekit import rtc
 from config import settings
-from vad import SileroVAD
+from vad import SileroVAD, VadGate
+from audio_buffer import PcmRingBuffer
 from stt.deepgram_stream import DeepgramStreamSTT
-from tts.eleven_stream import ElevenStreamTTS
+from tts.pool import pool as tts_pool
+from tts.playout import RoomAudioOut
+from tts.cache import cache as tts_cache
 from llm.openai_chat import ChatLLM
+from llm.chunker import sentence_chunks
+from llm.context import ConversationContext
 from memory import backend as mem
-from rag.query import RAG
+from rag.query import RAG, MODEL as RAG_MODEL, normalize
+from rag import query as rag_cache
+from rag.registry import get_encoder, index_version, registry as rag_registry
+from metrics import metrics, TurnTrace
 SYSTEM=settings.AGENT_SYSTEM_PROMPT
 
-def resolve_voice_for_user(user_id: str) -> str:
+_prewarming=set()
+
+async def resolve_voice_for_user(user_id: str) -> str:
+    voice_id=await _lookup_voice(user_id); prewarm(voice_id); return voice_id
+
+async def _lookup_voice(user_id: str) -> str:
     if settings.AGENT_VOICE_ID: return settings.AGENT_VOICE_ID
-    voice_id, status = mem.get_voice(user_id, settings.AGENT_VOICE_PROVIDER)
+    voice_id, status = await mem.aget_voice(user_id, settings.AGENT_VOICE_PROVIDER)
     if voice_id and status=='ready': return voice_id
     return settings.DEFAULT_VOICE_ID
 
-async def join_room(identity: str, name: str|None=None):
-    r=requests.post('http://api:8080/token', json={'identity':identity,'name':name or identity}); r.raise_for_status(); data=r.json()
+def prewarm(voice_id: str):
+    async def _run():
+        try: await tts_cache.ensure(tts_pool, voice_id, settings.AGENT_GREETING)
+        except Exception as e: print(f'Greeting pre-warm for {voice_id} failed: {e!r}')
+    task=asyncio.create_task(_run()); _prewarming.add(task); task.add_done_callback(_prewarming.discard)
+
+async def join_room(identity: str, room_name: str, name: str|None=None):
+    r=requests.post(f'{settings.API_URL}/token', json={'identity':identity,'room':room_name,'name':name or identity}); r.raise_for_status(); data=r.json()
     room=rtc.Room(); await room.connect(data['url'], data['token']); return room
 
-async def speak_text(text: str, tts_task_holder: dict, voice_id: str):
+def cancel_speech(tts_task_holder: dict):
     if tts_task_holder.get('task') and not tts_task_holder['task'].done(): tts_task_holder['task'].cancel()
-    async def _run():
-        async with ElevenStreamTTS(settings.ELEVENLABS_API_KEY, voice_id) as tts:
-            await tts.send_text(text)
-    task=asyncio.create_task(_run()); tts_task_holder['task']=task; await task
+
+async def stop_speech(tts_task_holder: dict):
+    """Cancel the playing reply and wait for it to clear its audio, so a new reply never shares the output with it."""
+    task=tts_task_holder.get('task'); cancel_speech(tts_task_holder)
+    if task: await asyncio.gather(task, return_exceptions=True)
+
+async def speak_phrase(text: str, voice_id: str, out: RoomAudioOut):
+    try:
+        async for pcm in tts_cache.read(tts_pool, voice_id, text): await out.play(pcm)
+        await out.flush()
+    except BaseException:
+        out.clear(); raise
+
+async def speak_stream(tokens, voice_id: str, spoken: list, out: RoomAudioOut, trace: TurnTrace|None=None):
+    async with tts_pool.stream(voice_id) as tts:
+        async def feed():
+            async with aclosing(tokens), aclosing(sentence_chunks(tokens)) as pieces:
+                async for piece in pieces:
+                    if trace: trace.mark('llm_first_sentence')
+                    await tts.send_text(piece + ' '); spoken.append(piece)
+            await tts.end()
+        feeder=asyncio.create_task(feed())
+        try:
+            async for pcm in tts.recv_audio():
+                if trace: trace.mark('tts_first_audio')
+                await out.play(pcm)
+            await feeder; await out.flush()
+        except BaseException:
+            out.clear(); raise
+        finally:
+            feeder.cancel(); await asyncio.gather(feeder, return_exceptions=True)
+
+async def respond(room_name: str, turn: list, context: ConversationContext, llm: ChatLLM, voice_id: str, out: RoomAudioOut, trace: TurnTrace|None=None):
+    spoken=[]; completed=False
+    try:
+        await speak_stream(llm.stream(turn, max_tokens=settings.CONTEXT_REPLY_TOKENS), voice_id, spoken, out, trace); completed=True
+    finally:
+        reply=' '.join(spoken)
+        if reply:
+            context.add('assistant', reply); await mem.aappend_message(room_name,'assistant',reply)
+        if trace: trace.finish(completed=completed, sentences=len(spoken), prompt_tokens=context.stats['prompt_last'])
+
+def open_rag(user_id: str, own: str | None) -> RAG:
+    """The user's rows of the shared index while they match the user's own index `own`, else `own` (or the default index)."""
+    opts=dict(backend=settings.RAG_BACKEND, nprobe=settings.RAG_NPROBE, ef_search=settings.RAG_EF_SEARCH, rerank_factor=settings.RAG_RERANK_FACTOR)
+    if settings.RAG_SHARED_INDEX and settings.RAG_BACKEND=='faiss':
+        try:
+            rag=RAG(base_dir=settings.RAG_SHARED_INDEX, tenant=user_id, **opts)
+            if own is None or rag.view.source==index_version(own): return rag
+            rag.close()
+        except (KeyError, FileNotFoundError):
+            pass
+    return RAG(base_dir=own or 'data/indexes/default', **opts)
+
+def pick_index(rag: RAG, own: str | None) -> tuple[str, str | None]:
+    """Where the session's index should now come from: its shared-index rows while they match the user's own index, else that index."""
+    if rag.tenant and (own is None or (rag.pending or rag.view).source==index_version(own)): return rag.base_dir, rag.tenant
+    return own or 'data/indexes/default', None
+
+async def watch_index(rag: RAG, user_id: str):
+    """Load new index versions, moving a shared-index session onto the user's own index once one is built (or the user
+    is dropped from the shared build). Repeated failures back off up to 64 polls and are logged once per distinct error."""
+    fails, last = 0, None
+    while True:
+        await asyncio.sleep(settings.RAG_RELOAD_POLL_S*min(2**fails, 64))
+        try:
+            own=await mem.aget_index_dir(user_id); base_dir, tenant = await asyncio.to_thread(pick_index, rag, own)
+            try: loaded=await asyncio.to_thread(rag.refresh, base_dir, tenant)
+            except KeyError:
+                if tenant is None: raise
+                loaded=await asyncio.to_thread(rag.refresh, own or 'data/indexes/default', None)
+            if loaded: print(f'New index for {user_id} loaded: {rag.pending.version}')
+            fails, last = 0, None
+        except Exception as e:
+            fails+=1
+            if repr(e)!=last: print(f'Index reload for {user_id} failed, backing off: {e!r}')
+            last=repr(e)
 
 async def handle_participant(room: rtc.Room, user_id: str):
-    llm=ChatLLM(api_key=settings.OPENAI_API_KEY)
-    base_dir = f'data/indexes/{user_id}' if os.path.exists(f'data/indexes/{user_id}') else 'data/indexes/default'
-    rag=RAG(backend=settings.RAG_BACKEND, base_dir=base_dir)
-    history=mem.load_history(room.name, limit=settings.HISTORY_RELOAD_TURNS)
-    messages=[{'role':'system','content':SYSTEM}] + [{'role':r,'content':c} for r,c in history]
-    greet='Hello! I’m ready. Start speaking whenever you like.'
-    messages.append({'role':'assistant','content':greet}); mem.append_message(room.name,'assistant',greet)
-    tts_task_holder={'task': None}; voice_id=resolve_voice_for_user(user_id)
-    audio_queue: asyncio.Queue[bytes] = asyncio.Queue(maxsize=32)
+    llm=ChatLLM(api_key=settings.OPENAI_API_KEY, base_url=settings.OPENAI_BASE_URL or None)
+    rag=await asyncio.to_thread(open_rag, user_id, await mem.aget_index_dir(user_id))
+    print(f"RAG ready for {user_id} from {rag.base_dir}{' (shared)' if rag.tenant else ''}: {rag_registry.snapshot()}")
+    history=await mem.aload_history(room.name, limit=settings.HISTORY_RELOAD_TURNS)
+    context=ConversationContext(SYSTEM, llm, budget=settings.CONTEXT_TOKEN_BUDGET, reserve=settings.CONTEXT_REPLY_TOKENS,
+                                keep_recent=settings.CONTEXT_KEEP_TURNS, summary_words=settings.CONTEXT_SUMMARY_WORDS)
+    context.extend(history)
+    greet=settings.AGENT_GREETING
+    context.add('assistant', greet); await mem.aappend_message(room.name,'assistant',greet)
+    tts_task_holder={'task': None}; voice_id=await resolve_voice_for_user(user_id)
+    warm=asyncio.create_task(tts_pool.warm(voice_id)); out=await RoomAudioOut(room, tts_pool.sample_rate).start()
+    tts_task_holder['task']=asyncio.create_task(speak_phrase(greet, voice_id, out))
+    audio=PcmRingBuffer(settings.AUDIO_SAMPLE_RATE, settings.AUDIO_CHUNK_MS, settings.AUDIO_BUFFER_MS)
     def on_track(track_pub, _):
         if isinstance(track_pub.track, rtc.RemoteAudioTrack):
-            track_pub.track.add_audio_frame_received(lambda f: audio_queue.put_nowait(f.data))
+            track_pub.track.add_audio_frame_received(lambda f: audio.write(f.data))
     room.on('track_subscribed', on_track)
-    async with DeepgramStreamSTT(settings.DEEPGRAM_API_KEY) as stt:
-        speaking=False
-        while True:
-            pcm = await audio_queue.get(); await stt.send_pcm(pcm)
-            if not speaking:
-                speaking=True
-                if tts_task_holder.get('task') and not tts_task_holder['task'].done(): tts_task_holder['task'].cancel()
-            text, is_final = await stt.recv_transcript()
-            if not text: continue
-            if is_final:
-                ctx = rag.topk(text, k=4); context_blob='\n\n'.join([c[0] for c in ctx])
-                turn = messages + [{'role':'user','content':text},{'role':'system','content':f'Relevant context (non-user visible)\n---\n{context_blob}'}]
-                reply = llm.complete(turn)
-                mem.append_message(room.name,'user',text); mem.append_message(room.name,'assistant',reply)
-                messages += [{'role':'user','content':text},{'role':'assistant','content':reply}]
-                await speak_text(reply, tts_task_holder, voice_id); speaking=False
-
-async def main():
-    user_id=os.getenv('DEMO_USER_ID','joyce'); room=await join_room(identity=user_id)
+    spec={'norm': None, 'task': None, 'last': ''}; rag_stats={'speculative_hits':0,'speculative_misses':0}
+    def on_interim(text: str):
+        norm=normalize(text); stable=bool(spec['last']) and norm.startswith(spec['last']); spec['last']=norm
+        if not stable or len(norm.split())<settings.RAG_SPECULATE_MIN_WORDS or norm==spec['norm']: return
+        if spec['task'] and not spec['task'].done(): return
+        spec['norm']=norm; spec['task']=asyncio.create_task(asyncio.to_thread(rag.topk, text, 4))
+    async def retrieve(text: str):
+        norm=normalize(text); guess, task = spec['norm'], spec['task']; spec.update(norm=None, task=None, last='')
+        if task and difflib.SequenceMatcher(None, guess, norm).ratio()>=settings.RAG_SPECULATE_MATCH:
+            rag_stats['speculative_hits']+=1; return await task
+        rag_stats['speculative_misses']+=task is not None
+        return await asyncio.to_thread(rag.topk, text, 4)
+    turn_trace={'trace': None}
+    async def on_final(text: str):
+        await stop_speech(tts_task_holder)
+        trace=turn_trace['trace'] or metrics.trace(room.name); turn_trace['trace']=None; trace.mark('stt_final')
+        if rag.swap(): spec.update(norm=None, task=None)
+        with metrics.span('rag_topk', room.name):
+            ctx = await retrieve(text)
+        trace.mark('rag'); context_blob='\n\n'.join([c[0] for c in ctx])
+        turn = context.build([{'role':'user','content':text}], {'role':'system','content':f'Relevant context (non-user visible)\n---\n{context_blob}'})
+        context.add('user', text); await mem.aappend_message(room.name,'user',text); trace.mark('prompt')
+        print(f"Prompt for {room.name}: {context.stats['prompt_last']} tokens, {len(turn)} messages")
+        tts_task_holder['task']=asyncio.create_task(respond(room.name, turn, context, llm, voice_id, out, trace))
+    gate=None
+    if settings.VAD_ENABLED:
+        vad=await asyncio.to_thread(SileroVAD, settings.AUDIO_SAMPLE_RATE, settings.VAD_THRESHOLD)
+        gate=VadGate(vad, audio.chunk_ms, settings.VAD_PREROLL_MS, settings.VAD_HANGOVER_MS)
+    watcher=asyncio.create_task(watch_index(rag, user_id)) if settings.RAG_RELOAD_POLL_S>0 else None
+    async with DeepgramStreamSTT(settings.DEEPGRAM_API_KEY, sample_rate=settings.AUDIO_SAMPLE_RATE, url=settings.DEEPGRAM_URL) as stt:
+        async def pump_audio():
+            while True:
+                chunk=await audio.read_chunk()
+                if gate is None:
+                    await stt.send_pcm(chunk); continue
+                segments, event = await gate.process(chunk)
+                if event=='start': cancel_speech(tts_task_holder)
+                for seg in segments: await stt.send_pcm(seg)
+                if event=='end': turn_trace['trace']=metrics.trace(room.name); await stt.finalize()
+        pump=asyncio.create_task(pump_audio())
+        try:
+            async for ev in stt:
+                if gate is None: cancel_speech(tts_task_holder)
+                if ev.is_final: await on_final(ev.text)
+                else: on_interim(ev.text)
+        finally:
+            pump.cancel(); warm.cancel(); cancel_speech(tts_task_holder)
+            if watcher: watcher.cancel()
+            context.close(); print(f'Context for {room.name}: {context.snapshot()}')
+            rag.close()
+            print(f'Audio buffer for {room.name}: {audio.stats()}')
+            if gate: gate.close(); print(f'VAD for {room.name}: {gate.stats}')
+            print(f'Memory writer: {mem.writer.snapshot()}, metadata cache: {mem.meta.snapshot()}')
+            print(f'TTS pool: {tts_pool.snapshot()}, audio cache: {tts_cache.snapshot()}')
+            print(f'Latency for {room.name}: {metrics.summary(room.name)}'); metrics.drop_session(room.name)
+            print(f'RAG for {room.name}: {rag_stats}, {rag.swaps} index swaps, registry {rag_registry.snapshot()}, embed cache {rag_cache.embeddings.hits}/{rag_cache.embeddings.misses}, result cache {rag_cache.results.hits}/{rag_cache.results.misses}')
+
+async def warm_up():
+    await asyncio.to_thread(get_encoder, RAG_MODEL)
+
+async def run_session(room_name: str, user_id: str):
+    room=await join_room(identity=f'agent-{user_id}', room_name=room_name, name='Agent'); left=asyncio.Event()
+    room.on('disconnected', lambda *_: left.set())
+    session=asyncio.create_task(handle_participant(room, user_id=user_id)); gone=asyncio.create_task(left.wait())
     try:
-        await handle_participant(room, user_id=user_id)
+        await asyncio.wait({session, gone}, return_when=asyncio.FIRST_COMPLETED)
+        if session.done(): session.result()
     finally:
-        await room.disconnect()
+        for t in (session, gone): t.cancel()
+        await asyncio.gather(session, gone, return_exceptions=True); await room.disconnect()
+
+async def shutdown():
+    await tts_pool.close(); await mem.writer.close()
+
+def main():
+    import uvicorn
+    from dispatcher import Dispatcher, create_app
+    dispatcher=Dispatcher(settings.AGENT_SHARDS or os.cpu_count() or 1, settings.AGENT_MAX_SESSIONS, settings.AGENT_MAX_LOAD); dispatcher.start()
+    if settings.DEMO_USER_ID:
+        threading.Thread(target=_autojoin, args=(dispatcher, settings.DEMO_USER_ID), daemon=True).start()
+    try:
+        uvicorn.run(create_app(dispatcher), host='0.0.0.0', port=settings.AGENT_PORT)
+    finally:
+        dispatcher.shutdown()
+
+def _autojoin(dispatcher, user_id: str, timeout_s=120.0):
+    deadline=time.time()+timeout_s
+    while not any(dispatcher.healthy(i) for i in range(dispatcher.n)) and time.time()<deadline: time.sleep(0.5)
+    try: dispatcher.assign(user_id, user_id)
+    except Exception as e: print(f'Auto-join for {user_id} failed: {e!r}')
 
 if __name__=='__main__':
-    asyncio.run(main())
+    main()
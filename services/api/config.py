@@ -6,6 +6,7 @@ class Settings(BaseSettings):
     LIVEKIT_API_KEY: str = os.getenv('LIVEKIT_API_KEY', '')
     LIVEKIT_API_SECRET: str = os.getenv('LIVEKIT_API_SECRET', '')
     DB_URL: str = os.getenv('DB_URL', 'sqlite:///./memory.db')
+    AGENT_METRICS_URL: str = os.getenv('AGENT_METRICS_URL', 'http://agent:8081/metrics')
 
     class Config:
         env_file = '.env'
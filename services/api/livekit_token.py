@@ -1,8 +1,8 @@
-import base64, hmac, hashlib, time
+import datetime
+from livekit import api
 
-def create_token(api_key: str, api_secret: str, identity: str, ttl: int = 3600):
-    now = int(time.time())
-    payload = f"{identity}|{now+ttl}"
-    sig = hmac.new(api_secret.encode(), payload.encode(), hashlib.sha256).digest()
-    token = base64.urlsafe_b64encode(f"{api_key}:{payload}:{base64.urlsafe_b64encode(sig).decode()}".encode()).decode()
-    return token
+def create_token(api_key: str, api_secret: str, identity: str, room: str, name: str | None = None, ttl: int = 3600):
+    """Join-only access token for one room."""
+    grants = api.VideoGrants(room_join=True, room=room)
+    return (api.AccessToken(api_key, api_secret).with_identity(identity).with_name(name or identity)
+            .with_grants(grants).with_ttl(datetime.timedelta(seconds=ttl)).to_jwt())
@@ -1,16 +1,32 @@
+import httpx
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from config import settings
 from livekit_token import create_token
+from metrics import RequestMetrics
 from models import TokenReq, TokenResp
 app = FastAPI(title='Voice Agent API')
 app.add_middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])
+request_metrics = RequestMetrics()
+app.middleware('http')(request_metrics.middleware)
 @app.get('/health')
 def health():
     return {'ok': True}
+@app.get('/metrics', response_class=PlainTextResponse)
+async def metrics():
+    text = request_metrics.render()
+    if settings.AGENT_METRICS_URL:
+        try:
+            async with httpx.AsyncClient(timeout=2.0) as client:
+                r = await client.get(settings.AGENT_METRICS_URL); r.raise_for_status(); text += r.text
+        except httpx.HTTPError as e:
+            text += f'# agent metrics unavailable: {e!r}\n'
+    return text
 @app.post('/token', response_model=TokenResp)
 def mint_token(req: TokenReq):
     if not req.identity:
         raise HTTPException(400, 'identity required')
-    token = create_token(settings.LIVEKIT_API_KEY, settings.LIVEKIT_API_SECRET, req.identity)
+    # Rooms are named after their user unless the caller picks one (the agent dispatcher's assignment, the demo room).
+    token = create_token(settings.LIVEKIT_API_KEY, settings.LIVEKIT_API_SECRET, req.identity, req.room or req.identity, req.name)
     return TokenResp(url=settings.LIVEKIT_URL, token=token)
@@ -0,0 +1,32 @@
+import threading, time
+from bisect import bisect_left
+BUCKETS_MS=(5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+class RequestMetrics:
+    """Request counts and latency histograms per route, rendered in Prometheus text format."""
+    def __init__(self, prefix='api'):
+        self.prefix=prefix; self.lock=threading.Lock(); self.hists: dict[str, list] = {}; self.codes: dict[tuple, int] = {}
+    def observe(self, route: str, status: int, ms: float):
+        with self.lock:
+            h=self.hists.get(route)
+            if h is None: h=self.hists[route]=[[0]*(len(BUCKETS_MS)+1), 0.0]
+            h[0][bisect_left(BUCKETS_MS, ms)]+=1; h[1]+=ms
+            self.codes[(route, status)]=self.codes.get((route, status), 0)+1
+    async def middleware(self, request, call_next):
+        t0=time.perf_counter(); status=500
+        try:
+            response=await call_next(request); status=response.status_code; return response
+        finally:
+            route=getattr(request.scope.get('route'), 'path', 'unmatched')
+            self.observe(route, status, (time.perf_counter()-t0)*1000)
+    def render(self) -> str:
+        name=f'{self.prefix}_request_latency_ms'; lines=[f'# TYPE {name} histogram']
+        with self.lock:
+            for route, (counts, total) in sorted(self.hists.items()):
+                seen=0
+                for bound, n in zip(BUCKETS_MS+('+Inf',), counts):
+                    seen+=n; lines.append(f'{name}_bucket{{route="{route}",le="{bound}"}} {seen}')
+                lines+= [f'{name}_sum{{route="{route}"}} {total:.3f}', f'{name}_count{{route="{route}"}} {seen}']
+            lines.append(f'# TYPE {self.prefix}_requests_total counter')
+            lines+= [f'{self.prefix}_requests_total{{route="{r}",status="{s}"}} {n}' for (r, s), n in sorted(self.codes.items())]
+        return '\n'.join(lines)+'\n'
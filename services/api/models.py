@@ -1,6 +1,7 @@
 from pydantic import BaseModel
 class TokenReq(BaseModel):
     identity: str
+    room: str | None = None
     name: str | None = None
 class TokenResp(BaseModel):
     url: str
@@ -1,28 +1,58 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from typing import List
+from fastapi.responses import JSONResponse
+from contextlib import asynccontextmanager
 from pydantic_settings import BaseSettings
 from pathlib import Path
-import shutil, requests
+import asyncio, hashlib, os, sys, uuid, httpx
+from multipart.exceptions import MultipartParseError
+from multipart.multipart import MultipartParser, parse_options_header
 from sqlalchemy import create_engine, text
 from sqlalchemy.orm import Session
+from jobs import JobQueue, agent_root
+if agent_root() not in sys.path: sys.path.insert(0, agent_root())
+from memory.changes import record_change
 
 class Settings(BaseSettings):
     ELEVENLABS_API_KEY: str
     DB_URL: str = 'sqlite:///./memory.db'
     MAX_DOC_MB: int = 50
+    MAX_UPLOAD_MB: int = 500
+    UPLOAD_CHUNK_KB: int = 1024
+    PROVIDER_TIMEOUT_S: float = 120.0
+    REINDEX_WORKERS: int = 1
+    INDEX_KEEP_VERSIONS: int = 2
     class Config:
         env_file = '.env'
 settings = Settings()
 
-app = FastAPI(title='Trainer API')
+SAMPLE_SUFFIXES={'.wav','.mp3','.m4a'}
+MB=1024*1024
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.http=httpx.AsyncClient(timeout=settings.PROVIDER_TIMEOUT_S, limits=httpx.Limits(max_connections=20, max_keepalive_connections=10))
+    jobs.start()
+    try: yield
+    finally: await jobs.close(); await app.state.http.aclose()
+
+app = FastAPI(title='Trainer API', lifespan=lifespan)
 app.add_middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])
+
+@app.middleware('http')
+async def limit_body(request: Request, call_next):
+    size=request.headers.get('content-length')
+    if size and size.isdigit() and int(size)>settings.MAX_UPLOAD_MB*MB:
+        return JSONResponse({'detail': f'Request body exceeds {settings.MAX_UPLOAD_MB} MB'}, status_code=413)
+    return await call_next(request)
+
 engine = create_engine(settings.DB_URL, future=True)
 
 def set_voice(user_id: str, provider: str, voice_id: str, status: str='ready'):
     with Session(engine) as s:
         s.execute(text("""INSERT INTO voices(user_id,provider,voice_id,status) VALUES(:u,:p,:v,:s)
-ON CONFLICT(user_id,provider) DO UPDATE SET voice_id=:v, status=:s"""), {'u':user_id,'p':provider,'v':voice_id,'s':status}); s.commit()
+ON CONFLICT(user_id,provider) DO UPDATE SET voice_id=:v, status=:s"""), {'u':user_id,'p':provider,'v':voice_id,'s':status})
+        record_change(s, 'voice', user_id); s.commit()
 
 def get_voice(user_id: str, provider: str):
     with Session(engine) as s:
@@ -30,27 +60,126 @@ def get_voice(user_id: str, provider: str):
         if row: return {'voice_id':row[0],'status':row[1]}
     return {'voice_id':None,'status':None}
 
+class UploadSink:
+    def __init__(self, dest_dir: Path, filename: str):
+        self.filename=filename; self.tmp=dest_dir/f'.upload-{uuid.uuid4().hex}'; self.f=open(self.tmp, 'wb')
+        self.buf=bytearray(); self.size=0; self.digest=hashlib.sha256()
+    async def write(self, data: bytes):
+        self.size+=len(data)
+        if self.size>settings.MAX_DOC_MB*MB: raise HTTPException(413, f'{self.filename} exceeds {settings.MAX_DOC_MB} MB')
+        self.digest.update(data); self.buf+=data
+        if len(self.buf)>=settings.UPLOAD_CHUNK_KB*1024: await self.flush()
+    async def flush(self):
+        if self.buf:
+            data=bytes(self.buf); self.buf.clear(); await asyncio.to_thread(self.f.write, data)
+    async def close(self) -> str:
+        await self.flush(); await asyncio.to_thread(self.f.close); return self.digest.hexdigest()
+    def discard(self):
+        self.f.close(); self.tmp.unlink(missing_ok=True)
+
+class PartEvents:
+    """python-multipart's streaming MultipartParser with its callbacks queued as ('begin', headers) / ('data', bytes) /
+    ('end', None) events, so receive_files can await the upload sinks between body chunks."""
+    def __init__(self, boundary: bytes, max_header=16384):
+        self.events=[]; self.headers={}; self.field=b''; self.value=b''; self.header_bytes=0; self.max_header=max_header; self.ended=False
+        self.parser=MultipartParser(boundary, {'on_part_begin':self._begin, 'on_header_field':self._field, 'on_header_value':self._value,
+                                               'on_header_end':self._header_end, 'on_headers_finished':self._headers_done,
+                                               'on_part_data':self._data, 'on_part_end':self._part_end, 'on_end':self._end})
+    def _begin(self):
+        self.headers={}; self.header_bytes=0
+    def _grow(self, n: int):
+        self.header_bytes+=n
+        if self.header_bytes>self.max_header: raise HTTPException(400, 'Multipart part headers too large')
+    def _field(self, data, start, end):
+        self._grow(end-start); self.field+=data[start:end]
+    def _value(self, data, start, end):
+        self._grow(end-start); self.value+=data[start:end]
+    def _header_end(self):
+        self.headers[self.field.strip().lower()]=self.value.strip(); self.field=self.value=b''
+    def _headers_done(self):
+        self.events.append(('begin', self.headers))
+    def _data(self, data, start, end):
+        self.events.append(('data', bytes(data[start:end])))
+    def _part_end(self):
+        self.events.append(('end', None))
+    def _end(self):
+        self.ended=True
+    def feed(self, data: bytes) -> list:
+        try: self.parser.write(data)
+        except MultipartParseError as e: raise HTTPException(400, f'Malformed multipart body: {e}') from e
+        events, self.events = self.events, []; return events
+    def finalize(self):
+        if not self.ended: raise HTTPException(400, 'Truncated multipart body')
+
+async def receive_files(request: Request, field: str, dest_dir: Path, suffixes=None) -> list[tuple[str, Path, str]]:
+    """Parse a multipart body as it arrives, streaming each `field` file part to a temp file in dest_dir.
+
+    Limits are enforced per chunk, so an oversized upload is refused before the rest of it is read.
+    Returns [(filename, tmp path, sha256)]; the caller moves the temp files into place.
+    """
+    ctype, opts = parse_options_header(request.headers.get('content-type', ''))
+    if ctype!=b'multipart/form-data' or not opts.get(b'boundary'): raise HTTPException(400, 'Expected multipart/form-data')
+    parts=PartEvents(opts[b'boundary']); done, sink, total = [], None, 0
+    try:
+        async for chunk in request.stream():
+            total+=len(chunk)
+            if total>settings.MAX_UPLOAD_MB*MB: raise HTTPException(413, f'Request body exceeds {settings.MAX_UPLOAD_MB} MB')
+            for kind, value in parts.feed(chunk):
+                if kind=='begin':
+                    _, disp = parse_options_header(value.get(b'content-disposition', b''))
+                    if disp.get(b'name', b'').decode()!=field or b'filename' not in disp: continue
+                    name=safe_name(disp[b'filename'].decode('utf-8', 'replace'))
+                    if suffixes and Path(name).suffix.lower() not in suffixes: raise HTTPException(400, f'Unsupported file type: {name}')
+                    sink=UploadSink(dest_dir, name)
+                elif kind=='data' and sink: await sink.write(value)
+                elif kind=='end' and sink: done.append((sink.filename, sink.tmp, await sink.close())); sink=None
+            await asyncio.sleep(0)
+        parts.finalize()
+    except BaseException:
+        if sink: sink.discard()
+        for _, tmp, _ in done: tmp.unlink(missing_ok=True)
+        raise
+    if not done: raise HTTPException(400, f'No {field} files in upload')
+    return done
+
+def file_sha256(path: Path) -> str:
+    h=hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024*1024), b''): h.update(block)
+    return h.hexdigest()
+
+def safe_name(filename: str | None) -> str:
+    name=Path(filename or '').name
+    if not name or name.startswith('.'): raise HTTPException(400, f'Invalid filename: {filename!r}')
+    return name
+
 @app.post('/voice/samples')
-async def upload_samples(user_id: str, samples: List[UploadFile] = File(...)):
+async def upload_samples(user_id: str, request: Request):
     out = Path(f'data/voice_samples/{user_id}'); out.mkdir(parents=True, exist_ok=True)
-    for f in samples:
-        dest = out / f.filename
-        with open(dest, 'wb') as w: shutil.copyfileobj(f.file, w)
-    return {'ok': True, 'saved': len(list(out.iterdir()))}
+    saved, duplicates = [], 0
+    for name, tmp, sha in await receive_files(request, 'samples', out, SAMPLE_SUFFIXES):
+        dest = out / f'{sha[:16]}{Path(name).suffix.lower()}'
+        if dest.exists(): tmp.unlink(); duplicates+=1
+        else: os.replace(tmp, dest); saved.append(dest.name)
+    return {'ok': True, 'saved': len(saved), 'files': saved, 'duplicates': duplicates, 'total': sum(1 for p in out.iterdir() if p.suffix.lower() in SAMPLE_SUFFIXES)}
 
 @app.post('/voice/elevenlabs/create')
 async def elevenlabs_create(user_id: str, voice_name: str):
     sample_dir = Path(f'data/voice_samples/{user_id}')
     if not sample_dir.exists(): raise HTTPException(400,'No samples uploaded.')
-    files=[('files',(p.name, open(p,'rb'), 'application/octet-stream')) for p in sample_dir.glob('*') if p.suffix.lower() in {'.wav','.mp3','.m4a'}]
-    if not files: raise HTTPException(400,'No valid audio samples found.')
+    paths=sorted(p for p in sample_dir.glob('*') if p.suffix.lower() in SAMPLE_SUFFIXES)
+    if not paths: raise HTTPException(400,'No valid audio samples found.')
+    files=[('files',(p.name, await asyncio.to_thread(p.read_bytes), 'application/octet-stream')) for p in paths]
     headers={'xi-api-key': settings.ELEVENLABS_API_KEY}
     data={'name': voice_name}
-    resp=requests.post('https://api.elevenlabs.io/v1/voices/add', headers=headers, files=files, data=data)
+    try:
+        resp=await app.state.http.post('https://api.elevenlabs.io/v1/voices/add', headers=headers, files=files, data=data)
+    except httpx.HTTPError as e:
+        raise HTTPException(502, f'ElevenLabs request failed: {e!r}')
     if resp.status_code>=300: raise HTTPException(resp.status_code, f'ElevenLabs error: {resp.text}')
     voice_id = resp.json().get('voice_id') or resp.json().get('voice',{}).get('voice_id')
     if not voice_id: raise HTTPException(500, f'Unexpected provider response: {resp.text}')
-    set_voice(user_id, 'elevenlabs', voice_id, 'ready')
+    await asyncio.to_thread(set_voice, user_id, 'elevenlabs', voice_id, 'ready')
     return {'ok': True, 'provider': 'elevenlabs', 'voice_id': voice_id}
 
 @app.get('/voice/get')
@@ -58,20 +187,34 @@ def voice_get(user_id: str, provider: str = 'elevenlabs'):
     return get_voice(user_id, provider)
 
 @app.post('/persona/upload')
-async def persona_upload(user_id: str, files: List[UploadFile] = File(...)):
+async def persona_upload(user_id: str, request: Request):
     root = Path(f'data/persona/{user_id}'); root.mkdir(parents=True, exist_ok=True)
-    for f in files:
-        dest = root / f.filename
-        with open(dest, 'wb') as w: shutil.copyfileobj(f.file, w)
-    return {'ok': True, 'user_id': user_id}
-
-@app.post('/persona/reindex')
-def persona_reindex(user_id: str):
-    import subprocess, sys
-    corpus=f'data/persona/{user_id}'; out=f'data/indexes/{user_id}'
-    Path(corpus).mkdir(parents=True, exist_ok=True); Path(out).mkdir(parents=True, exist_ok=True)
-    result = subprocess.run([sys.executable, 'services/agent/rag/indexer.py', '--corpus', corpus, '--out', out], capture_output=True, text=True)
-    if result.returncode != 0: raise HTTPException(500, f'Indexing failed: {result.stderr}')
+    saved, unchanged = [], 0
+    for name, tmp, sha in await receive_files(request, 'files', root):
+        dest = root / name
+        if dest.exists() and await asyncio.to_thread(file_sha256, dest)==sha: tmp.unlink(); unchanged+=1
+        else: os.replace(tmp, dest); saved.append(dest.name)
+    return {'ok': True, 'user_id': user_id, 'saved': saved, 'unchanged': unchanged}
+
+def record_index(user_id: str, path: str):
     with Session(engine) as s:
-        s.execute(text('INSERT INTO persona_index(user_id,backend,path) VALUES(:u,:b,:p)'), {'u':user_id,'b':'faiss','p':out}); s.commit()
-    return {'ok': True, 'index_path': out, 'log': result.stdout}
+        s.execute(text('INSERT INTO persona_index(user_id,backend,path) VALUES(:u,:b,:p)'), {'u':user_id,'b':'faiss','p':path})
+        record_change(s, 'index', user_id); s.commit()
+
+jobs = JobQueue(workers=settings.REINDEX_WORKERS, keep_versions=settings.INDEX_KEEP_VERSIONS, on_success=record_index)
+
+@app.post('/persona/reindex', status_code=202)
+async def persona_reindex(user_id: str, full: bool = False):
+    if Path(user_id).name!=user_id or user_id.startswith('.'): raise HTTPException(400, f'Invalid user_id: {user_id!r}')
+    job, merged = jobs.submit(user_id, full)
+    return {'ok': True, 'job_id': job.id, 'state': job.state, 'merged': merged, 'index_path': f'data/indexes/{user_id}'}
+
+@app.get('/persona/jobs/{job_id}')
+def persona_job(job_id: str, log: bool = False):
+    job=jobs.get(job_id)
+    if not job: raise HTTPException(404, 'Unknown job')
+    return job.info(log)
+
+@app.get('/persona/jobs')
+def persona_jobs(user_id: str | None = None):
+    return {'jobs': [j.info() for j in (jobs.for_user(user_id) if user_id else reversed(jobs.jobs.values()))], 'stats': jobs.snapshot()}
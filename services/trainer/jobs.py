@@ -0,0 +1,96 @@
+import asyncio, contextlib, io, multiprocessing as mp, os, sys, time, traceback, uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field, asdict
+from pathlib import Path
+
+def agent_root() -> str:
+    """Directory holding the agent's `rag` package: AGENT_ROOT, else next to this file (the image copies it in), else the repo checkout."""
+    here=Path(__file__).resolve().parent
+    return os.getenv('AGENT_ROOT') or str(next((p for p in (here, here.parent/'agent') if (p/'rag').is_dir()), here))
+
+def _init_worker(root: str):
+    if root not in sys.path: sys.path.insert(0, root)
+    from rag.indexer import MODEL
+    from rag.registry import get_encoder
+    get_encoder(MODEL)
+
+def run_build(corpus: str, out: str, full: bool, keep: int) -> tuple[str, str]:
+    from rag.indexer import build_version, env_options
+    log=io.StringIO()
+    with contextlib.redirect_stdout(log):
+        version=build_version(corpus, out, full=full, keep=keep, **env_options())
+    return str(version), log.getvalue()
+
+@dataclass
+class Job:
+    user_id: str
+    full: bool = False
+    id: str = field(default_factory=lambda: uuid.uuid4().hex[:12])
+    state: str = 'queued'
+    created: float = field(default_factory=time.time)
+    started: float | None = None
+    finished: float | None = None
+    requests: int = 1
+    version: str | None = None
+    error: str | None = None
+    log: str = ''
+    def info(self, log=False) -> dict:
+        d=asdict(self)
+        if not log: d.pop('log')
+        return d
+
+class JobQueue:
+    """Per-user deduplicated reindex jobs run on a pool of processes that keep the encoder loaded.
+
+    A request for a user with a queued job joins that job; one arriving while the user's
+    build is running queues a follow-up so documents uploaded mid-build are picked up.
+    """
+    def __init__(self, workers=1, keep_versions=2, history=200, on_success=None, root=None):
+        self.workers=workers; self.keep=keep_versions; self.history=history; self.on_success=on_success
+        self.root=root or agent_root(); self.pool=None
+        self.jobs: OrderedDict[str, Job] = OrderedDict(); self.running: dict[str, Job] = {}; self.queued: dict[str, Job] = {}
+        self.tasks=set(); self.stats={'submitted':0,'merged':0,'done':0,'failed':0,'pool_restarts':0}
+    def start(self):
+        self.pool=ProcessPoolExecutor(self.workers, mp_context=mp.get_context('spawn'), initializer=_init_worker, initargs=(self.root,))
+    def submit(self, user_id: str, full=False) -> tuple[Job, bool]:
+        self.stats['submitted']+=1; job=self.queued.get(user_id)
+        if job:
+            job.requests+=1; job.full|=full; self.stats['merged']+=1; return job, True
+        job=self.queued[user_id]=Job(user_id, full); self.jobs[job.id]=job
+        self._trim(); self._pump(); return job, False
+    def get(self, job_id: str) -> Job | None:
+        return self.jobs.get(job_id)
+    def for_user(self, user_id: str) -> list[Job]:
+        return [j for j in reversed(self.jobs.values()) if j.user_id==user_id]
+    def _pump(self):
+        for user_id, job in list(self.queued.items()):
+            if len(self.running)>=self.workers: break
+            if user_id in self.running: continue
+            del self.queued[user_id]; self.running[user_id]=job
+            task=asyncio.create_task(self._run(job)); self.tasks.add(task); task.add_done_callback(self.tasks.discard)
+    async def _run(self, job: Job):
+        job.state='running'; job.started=time.time()
+        corpus=f'data/persona/{job.user_id}'; out=f'data/indexes/{job.user_id}'
+        os.makedirs(corpus, exist_ok=True); pool=self.pool
+        try:
+            job.version, job.log = await asyncio.get_running_loop().run_in_executor(pool, run_build, corpus, out, job.full, self.keep)
+            if self.on_success: await asyncio.to_thread(self.on_success, job.user_id, out)
+            job.state='done'; self.stats['done']+=1
+        except BrokenProcessPool as e:
+            # A worker died (e.g. OOM-killed loading the encoder); every later submit would fail on this pool, so replace it.
+            job.state='failed'; job.error=f'Build worker died: {e}'; self.stats['failed']+=1
+            if self.pool is pool: pool.shutdown(wait=False, cancel_futures=True); self.start(); self.stats['pool_restarts']+=1
+        except Exception as e:
+            job.state='failed'; job.error=''.join(traceback.format_exception_only(e)).strip(); self.stats['failed']+=1
+        finally:
+            job.finished=time.time(); self.running.pop(job.user_id, None); self._pump()
+    def _trim(self):
+        for job_id in [k for k,j in self.jobs.items() if j.state in ('done','failed')][:max(0, len(self.jobs)-self.history)]:
+            del self.jobs[job_id]
+    def snapshot(self) -> dict:
+        return {**self.stats, 'queued':len(self.queued), 'running':len(self.running), 'workers':self.workers}
+    async def close(self):
+        for task in list(self.tasks): task.cancel()
+        if self.pool: self.pool.shutdown(wait=False, cancel_futures=True)